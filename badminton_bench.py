@@ -0,0 +1,508 @@
+"""
+预约流程基准测试
+
+e2e: 基于本地替身服务器反复执行complete_booking_process（及更快的下单模式），
+     统计放票到订单被受理的延迟p50/p95/p99以及抢到场地的比例。
+decode: 用大体积的合成场地数据比较原解码方式（response.json + 格式化整个字典写日志）
+        与精简解码（直接解码字节、不格式化）的解码+选场耗时。
+micro:  决策路径的微基准（选场、构造订单、日志、放票时刻计算等非网络逻辑），记录每次调用的耗时和
+        内存分配峰值；--save把结果保存为仓库中的基准文件bench_baseline.json。
+compare: 重新运行微基准并与基准文件比较，耗时超出容差时以非零状态退出。
+scan:   多场馆、多日期的场地余量查询：逐个查询与经同一连接池并发查询的耗时（以往返时延为单位）。
+startup: 冷启动耗时：全新解释器导入badminton_booking、badminton_gui的耗时，以及GUI（源码或打包后的exe）
+         从进程启动到窗口首次显示、到会话就绪（恢复缓存会话完成）的耗时；--save把结果记入基准文件的startup部分。
+
+用法：python badminton_bench.py e2e --runs 10 --competitors 4 --latency-ms 20
+      python badminton_bench.py e2e --runs 40 --modes sequential hedged --stall-probability 0.05
+      python badminton_bench.py decode --courts 50 200 1000
+      python badminton_bench.py micro --save
+      python badminton_bench.py compare --tolerance 0.5
+      python badminton_bench.py scan --venues 4 --dates 2 --latency-ms 30
+      python badminton_bench.py startup --runs 5 --exe dist/羽毛球预约系统/羽毛球预约系统.exe
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+import pytz
+
+from badminton_booking import BadmintonBooking, LogRecord
+from badminton_mock_server import MockOpenscServer, CANCEL_ORDER_PATH
+from badminton_model import Availability, decode_json, orjson
+from badminton_venues import Venue
+
+# 下单模式 -> 需要修改的BadmintonBooking属性
+MODES = {
+    "sequential": {"order_fanout": 1, "burst_window_ms": None},
+    "fanout": {"order_fanout": 4, "burst_window_ms": None},
+    "burst": {"order_fanout": 1},
+    "burst-fanout": {"order_fanout": 2},
+    "hedged": {"order_fanout": 1, "burst_window_ms": None, "order_hedge": 2},
+    "hedged-delay": {"order_fanout": 1, "burst_window_ms": None, "order_hedge": 2, "hedge_delay_ms": 20.0},
+}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """最近秩法百分位数"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values: List[float]) -> str:
+    return (f"p50 {percentile(values, 50):7.1f} ms  p95 {percentile(values, 95):7.1f} ms  "
+            f"p99 {percentile(values, 99):7.1f} ms")
+
+
+def new_bench_booking(server: MockOpenscServer, settings: Dict[str, Any], verbose: bool) -> BadmintonBooking:
+    """创建指向替身服务器的预约实例，缩短预热时间以加快测试"""
+    booking = BadmintonBooking()
+    booking.base_url = server.base_url
+    booking.warm_lead = 1.5
+    booking.verify_lead = 0.3
+    booking.cancel_order_path = CANCEL_ORDER_PATH
+    for name, value in settings.items():
+        setattr(booking, name, value)
+    if not verbose:
+        booking.log_sink = lambda record: None
+    booking.login_with_sms("13800000000", "000000")
+    return booking
+
+
+def schedule_release(server: MockOpenscServer, booking: BadmintonBooking, delay: float) -> float:
+    """把替身服务器和预约实例的放票时刻设为delay秒后的整秒，返回服务器时钟下的放票时刻"""
+    release_at = math.ceil(server.server_time() + delay)
+    server.reset(release_at)
+    server.schedule_competitors()
+    release = datetime.fromtimestamp(release_at, pytz.timezone("Asia/Shanghai"))
+    booking.release_hour = release.hour
+    booking.release_minute = release.minute
+    booking.release_second = release.second
+    return release_at
+
+
+def run_e2e(server: MockOpenscServer, mode: str, runs: int, time_slot: str,
+            verbose: bool = False) -> Dict[str, Any]:
+    """
+    以指定下单模式反复执行完整预约流程，返回延迟列表和胜率
+    """
+    latencies = []
+    wins = 0
+    order_requests = 0
+    # 同一模式的各轮复用一次时钟校准
+    booking = new_bench_booking(server, MODES[mode], verbose)
+    booking.sync_server_clock()
+    for _ in range(runs):
+        release_at = schedule_release(server, booking, delay=3.0)
+        result = booking.complete_booking_process("", "", "2025-01-01", time_slot)
+        order_requests += server.request_counts.get("/order/createOrderBatch", 0)
+        if result.get("success"):
+            wins += 1
+            accepted = server.orders_by(booking.token)
+            if accepted:
+                latencies.append((min(order[2] for order in accepted) - release_at) * 1000)
+    booking.session.close()
+    return {"mode": mode, "runs": runs, "wins": wins, "latencies": latencies, "order_requests": order_requests}
+
+
+def e2e_command(args):
+    server = MockOpenscServer(courts=args.courts, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                              clock_skew_ms=args.clock_skew_ms, competitors=args.competitors,
+                              competitor_delay_ms=(args.competitor_min_ms, args.competitor_max_ms),
+                              contested_slot=args.time_slot, stall_probability=args.stall_probability,
+                              stall_ms=args.stall_ms).start()
+    try:
+        baseline = None
+        for mode in args.modes:
+            stats = run_e2e(server, mode, args.runs, args.time_slot, args.verbose)
+            per_run = stats["order_requests"] / max(1, stats["runs"])
+            print(f"{mode:<12} 胜率 {stats['wins']}/{stats['runs']}  放票->受理 {summarize(stats['latencies'])}  "
+                  f"下单请求 {per_run:.1f} 个/轮")
+            p99 = percentile(stats["latencies"], 99)
+            if baseline is None:
+                baseline = (mode, p99)
+            else:
+                print(f"{'':<12} p99 相对 {baseline[0]}: {p99 - baseline[1]:+.1f} ms")
+    finally:
+        server.stop()
+
+
+# 微基准的基准文件，与本文件放在一起提交
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+# 微基准使用的场地数据规模：(名称, 场地数, 每块场地的时间段数, 日期数)
+MICRO_SIZES = (
+    ("typical", 8, 14, 1),
+    ("large", 60, 14, 3),
+    ("extreme", 400, 24, 7),
+)
+
+
+def synthetic_availability(courts: int, slots_per_court: int, date: str = "2025-01-01",
+                           first_id: int = 100000) -> bytes:
+    """
+    合成的getSpaceOrderDetailsNew响应：每块场地每个时间段一条，带上真实接口中下单逻辑用不到的字段
+    """
+    open_slice = {}
+    slice_id = first_id
+    for court in range(1, courts + 1):
+        for slot in range(slots_per_court):
+            slice_id += 1
+            start = 8 * 60 + slot * 60
+            slice_time = f"{start // 60:02d}:{start % 60:02d}--{(start + 120) // 60:02d}:{start % 60:02d}"
+            open_slice[str(slice_id)] = {
+                "slice_time": slice_time,
+                "is_lock": 1 if slice_id % 3 == 0 else 0,
+                "slice_name": f"{court}号场",
+                "price": "30.00",
+                "member_price": "25.00",
+                "space_id": "111162",
+                "sport_type": "2",
+                "remark": "",
+                "open_date": date,
+            }
+    return json.dumps({"actionState": 1, "data": {"openSlice": open_slice}}, ensure_ascii=False).encode("utf-8")
+
+
+def time_call(func, repeat: int) -> float:
+    """多次执行取中位数耗时（毫秒）"""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+    return percentile(durations, 50)
+
+
+def decode_command(args):
+    booking = BadmintonBooking()
+    booking.log_sink = lambda record: None
+    time_slot = "18:00--20:00,16:00--18:00"
+
+    def legacy(body):
+        # 原先的做法：先解码为文本再解析，把整个字典格式化进日志，再为全部场地建立模型
+        result = json.loads(body.decode("utf-8"))
+        f"可预约场地: {result}"
+        availability = Availability.from_response(result, "2025-01-01")
+        return booking.select_courts(availability, "2025-01-01", time_slot)
+
+    def lean(body):
+        return booking.find_available_courts_by_time(decode_json(body), time_slot, "2025-01-01")
+
+    print(f"JSON解码器: {'orjson' if orjson is not None else 'json'}")
+    for courts in args.courts:
+        body = synthetic_availability(courts, args.slots)
+        assert legacy(body) == lean(body)
+        legacy_ms = time_call(lambda: legacy(body), args.repeat)
+        lean_ms = time_call(lambda: lean(body), args.repeat)
+        print(f"{courts:>5} 块场地 {len(body) / 1024:8.0f} KB  原方式 {legacy_ms:7.2f} ms  "
+              f"精简解码 {lean_ms:7.2f} ms  加速 {legacy_ms / lean_ms:4.1f}x")
+
+
+def measure_call(func, min_time: float = 0.05, repeat: int = 7) -> Dict[str, float]:
+    """
+    单次调用的耗时（微秒，取多轮中的最小值）和内存分配峰值（KB，用tracemalloc单独测量）
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"time_us": round(best / number * 1e6, 3), "peak_kb": round((peak - base) / 1024, 2)}
+
+
+def micro_cases() -> Dict[str, Any]:
+    """微基准用例：名称 -> 无参函数"""
+    def calibration():
+        # 固定的纯Python工作量，比较时用它换算不同机器或负载下的速度差异
+        total = 0
+        for i in range(2000):
+            total += i * i % 7
+        return total
+
+    cases = {"calibration": calibration}
+    booking = BadmintonBooking()
+    booking.log_sink = lambda record: None
+    booking.token, booking.user_id, booking.phone_str = "bench-token", "u1", "13800000000"
+    booking.court_order = ["3号场", "5号场", "1号场"]
+    time_slot = "18:00--20:00,16:00--18:00"
+
+    for name, courts, slots, dates in MICRO_SIZES:
+        payloads = []
+        for index in range(dates):
+            date = f"2025-01-{index + 1:02d}"
+            body = synthetic_availability(courts, slots, date, first_id=100000 + index * courts * slots)
+            payloads.append((date, body, decode_json(body)))
+        date, body, courts_data = payloads[0]
+
+        cases[f"decode[{name}]"] = lambda body=body: decode_json(body)
+        cases[f"find_courts[{name}]"] = (
+            lambda courts_data=courts_data, date=date:
+            booking.find_available_courts_by_time(courts_data, time_slot, date))
+
+        def model_update(payloads=payloads):
+            model = Availability()
+            for date, _, courts_data in payloads:
+                model.update(courts_data, date)
+            return model
+
+        cases[f"model_update[{name}x{dates}d]"] = model_update
+        model = model_update()
+
+        def model_refresh(model=model, payloads=payloads):
+            # 后台轮询的常态：用内容不变的新快照逐个日期刷新已有模型
+            for date, _, courts_data in payloads:
+                model.update(courts_data, date)
+
+        cases[f"model_refresh[{name}x{dates}d]"] = model_refresh
+        cases[f"select_courts[{name}]"] = (
+            lambda model=model, date=date: booking.select_courts(model, date, time_slot))
+
+    cases["build_order_request"] = lambda: booking.build_order_request("100001")
+    cases["log_message[dropped_debug]"] = lambda: booking.log_message("调试信息", level="DEBUG", payload=cases)
+    cases["log_message[info]"] = lambda: booking.log_message("创建订单结果: actionState=1", payload=cases)
+    record = LogRecord(time.time(), "INFO", "创建订单结果: actionState=1", {"actionState": 1, "data": {}})
+    cases["log_record_format"] = lambda: record.format()
+    cases["get_release_target"] = booking.get_release_target
+    # 放票时刻已过时的等待开销（时刻计算、日志和自旋循环的固定成本）
+    cases["wait_until_release[past]"] = lambda: booking.wait_until_release(time.time() - 1)
+    return cases
+
+
+def run_micro() -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name, func in micro_cases().items():
+        results[name] = measure_call(func)
+    return results
+
+
+def micro_command(args):
+    results = run_micro()
+    for name, stats in results.items():
+        print(f"{name:<34} {stats['time_us']:12.2f} us  峰值分配 {stats['peak_kb']:10.2f} KB")
+    if args.save:
+        save_baseline(args.baseline, {"machine": machine_description(), "results": results})
+
+
+def machine_description() -> str:
+    return f"{platform.system()} {platform.machine()} Python {platform.python_version()}"
+
+
+def save_baseline(path: str, sections: Dict[str, Any]):
+    """更新基准文件中的指定部分，保留其余部分"""
+    baseline = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            baseline = json.load(f)
+    baseline.update(sections)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+    print(f"基准已保存到 {path}")
+
+
+def compare_command(args):
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"基准环境: {baseline.get('machine')}")
+    results = run_micro()
+    # 按校准用例的耗时比例换算，抵消机器和负载造成的整体快慢
+    speed = results["calibration"]["time_us"] / baseline["results"]["calibration"]["time_us"]
+    print(f"校准系数: x{speed:.2f}")
+    regressions = []
+    for name, stats in results.items():
+        base = baseline["results"].get(name)
+        if name == "calibration":
+            continue
+        if base is None:
+            print(f"{name:<34} {stats['time_us']:12.2f} us  （无基准）")
+            continue
+        ratio = stats["time_us"] / (base["time_us"] * speed) if base["time_us"] else float("inf")
+        alloc_delta = stats["peak_kb"] - base["peak_kb"]
+        flag = ""
+        if ratio > 1 + args.tolerance:
+            flag = "  <-- 变慢"
+            regressions.append(name)
+        print(f"{name:<34} {stats['time_us']:12.2f} us  x{ratio:5.2f}  峰值分配 {alloc_delta:+9.2f} KB{flag}")
+    if regressions:
+        print(f"{len(regressions)} 项超出容差 {args.tolerance:.0%}: {', '.join(regressions)}")
+        raise SystemExit(1)
+    print("全部在容差范围内")
+
+
+def scan_command(args):
+    spaces = tuple(str(111162 + index) for index in range(args.venues))
+    dates = [f"2025-01-{index + 1:02d}" for index in range(args.dates)]
+    server = MockOpenscServer(courts=args.courts, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                              spaces=spaces, dates=tuple(dates)).start()
+    try:
+        results = {}
+        for mode, workers in (("sequential", 1), ("parallel", args.venues * args.dates)):
+            booking = new_bench_booking(server, {"scan_workers": workers}, verbose=False)
+            booking.venues = [Venue(space_id, "2", f"场馆{space_id}") for space_id in spaces]
+            booking.warm_pool_size = len(spaces) * len(dates)
+            booking._mount_adapter(booking.warm_pool_size)
+            # 先建立好长连接，只比较查询本身
+            booking.scan_availability(dates)
+            durations = []
+            for _ in range(args.runs):
+                scan = booking.scan_availability(dates)
+                assert not scan["errors"], scan["errors"]
+                durations.append(scan["elapsed_ms"])
+            candidates = booking.select_courts(scan["availability"], dates[0], args.time_slot, tuple(dates[1:]))
+            booking.close()
+            results[mode] = durations
+            print(f"{mode:<11} {len(spaces)} 场馆 × {len(dates)} 日期  {summarize(durations)}  "
+                  f"约 {percentile(durations, 50) / args.latency_ms:4.1f} 个往返  候选场地 {len(candidates)} 个")
+    finally:
+        server.stop()
+    speedup = percentile(results["sequential"], 50) / percentile(results["parallel"], 50)
+    print(f"并发查询加速: {speedup:.1f}x")
+
+
+def measure_import(module: str) -> float:
+    """在全新解释器中导入模块的耗时（毫秒）"""
+    code = f"import time; t = time.perf_counter(); import {module}; print((time.perf_counter() - t) * 1000)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def measure_gui_start(command: List[str], timeout: float) -> Dict[str, Any]:
+    """
+    启动GUI并等待其写出启动时刻，返回距进程启动的毫秒数
+    """
+    from badminton_gui import STARTUP_PROBE_ENV
+
+    fd, probe_path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    try:
+        env = dict(os.environ, **{STARTUP_PROBE_ENV: probe_path})
+        started = time.time()
+        subprocess.run(command, env=env, timeout=timeout, check=True,
+                       cwd=os.path.dirname(os.path.abspath(__file__)))
+        with open(probe_path, encoding="utf-8") as f:
+            marks = json.load(f)
+    finally:
+        os.remove(probe_path)
+    return {
+        "first_frame_ms": (marks["first_frame"] - started) * 1000,
+        "session_ready_ms": (marks["session_ready"] - started) * 1000,
+        "session_restored": marks.get("session_restored", False),
+    }
+
+
+def startup_command(args):
+    startup = {"machine": machine_description(), "runs": args.runs}
+    for module in ("badminton_booking", "badminton_gui"):
+        imports = [measure_import(module) for _ in range(args.runs)]
+        startup[f"import_{module}_p50_ms"] = round(percentile(imports, 50), 1)
+        print(f"导入{module:<18} p50 {percentile(imports, 50):7.1f} ms")
+
+    if not args.no_gui:
+        command = [args.exe] if args.exe else [sys.executable, "badminton_gui.py"]
+        runs = [measure_gui_start(command, args.timeout) for _ in range(args.runs)]
+        restored = sum(1 for run in runs if run["session_restored"])
+        print(f"启动->窗口首次显示    {summarize([run['first_frame_ms'] for run in runs])}")
+        print(f"启动->会话就绪        {summarize([run['session_ready_ms'] for run in runs])}  "
+              f"（恢复缓存会话 {restored}/{len(runs)}）")
+        startup["target"] = "exe" if args.exe else "source"
+        startup["first_frame_p50_ms"] = round(percentile([run["first_frame_ms"] for run in runs], 50), 1)
+        startup["session_ready_p50_ms"] = round(percentile([run["session_ready_ms"] for run in runs], 50), 1)
+    if args.save:
+        save_baseline(args.baseline, {"startup": startup})
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="羽毛球预约基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    e2e = subparsers.add_parser("e2e", help="基于替身服务器的端到端延迟和胜率")
+    e2e.add_argument("--runs", type=int, default=10)
+    e2e.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    e2e.add_argument("--courts", type=int, default=8)
+    e2e.add_argument("--time-slot", default="18:30--20:30")
+    e2e.add_argument("--latency-ms", type=float, default=10.0)
+    e2e.add_argument("--jitter-ms", type=float, default=10.0)
+    e2e.add_argument("--clock-skew-ms", type=float, default=0.0)
+    e2e.add_argument("--competitors", type=int, default=4)
+    e2e.add_argument("--competitor-min-ms", type=float, default=5.0)
+    e2e.add_argument("--competitor-max-ms", type=float, default=80.0)
+    e2e.add_argument("--stall-probability", type=float, default=0.0,
+                     help="请求偶发长停顿（模拟丢包重传）的概率")
+    e2e.add_argument("--stall-ms", type=float, default=200.0)
+    e2e.add_argument("--verbose", action="store_true", help="输出预约流程日志")
+    e2e.set_defaults(func=e2e_command)
+
+    decode = subparsers.add_parser("decode", help="场地数据的解码+选场耗时")
+    decode.add_argument("--courts", type=int, nargs="+", default=[50, 200, 1000])
+    decode.add_argument("--slots", type=int, default=14, help="每块场地的时间段数")
+    decode.add_argument("--repeat", type=int, default=20)
+    decode.set_defaults(func=decode_command)
+
+    micro = subparsers.add_parser("micro", help="决策路径的微基准")
+    micro.add_argument("--save", action="store_true", help="保存为基准文件")
+    micro.add_argument("--baseline", default=BASELINE_PATH)
+    micro.set_defaults(func=micro_command)
+
+    compare = subparsers.add_parser("compare", help="与基准文件比较微基准结果")
+    compare.add_argument("--baseline", default=BASELINE_PATH)
+    compare.add_argument("--tolerance", type=float, default=0.5,
+                         help="允许的耗时增加比例（换算校准系数之后）")
+    compare.set_defaults(func=compare_command)
+
+    scan = subparsers.add_parser("scan", help="多场馆、多日期场地余量查询的耗时")
+    scan.add_argument("--venues", type=int, default=4)
+    scan.add_argument("--dates", type=int, default=2)
+    scan.add_argument("--courts", type=int, default=8)
+    scan.add_argument("--runs", type=int, default=20)
+    scan.add_argument("--time-slot", default="18:30--20:30,16:30--18:30")
+    scan.add_argument("--latency-ms", type=float, default=30.0)
+    scan.add_argument("--jitter-ms", type=float, default=5.0)
+    scan.set_defaults(func=scan_command)
+
+    startup = subparsers.add_parser("startup", help="导入和GUI冷启动耗时")
+    startup.add_argument("--runs", type=int, default=5)
+    startup.add_argument("--exe", help="打包后的程序路径（默认用当前解释器运行badminton_gui.py）")
+    startup.add_argument("--timeout", type=float, default=60.0)
+    startup.add_argument("--no-gui", action="store_true", help="只测量导入耗时（无图形界面的环境）")
+    startup.add_argument("--save", action="store_true", help="把结果记入基准文件的startup部分")
+    startup.add_argument("--baseline", default=BASELINE_PATH)
+    startup.set_defaults(func=startup_command)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,229 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util import connection as urllib3_connection
 import json
+import math
+import queue
+import socket
+import subprocess
+import sys
 import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, replace
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, List
-import qrcode
-from PIL import Image
+from typing import Dict, Any, Optional, List, Tuple
 import io
 import os
-import pytz
+import statistics
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from contextlib import nullcontext
+
+from badminton_timeline import RunTimeline, current_trace, set_current_trace
+from badminton_watcher import AvailabilityWatcher, RecaptureWatcher
+from badminton_model import Availability, decode_json, parse_time_slots
+from badminton_session_store import SessionStore, token_expiry
+from badminton_venues import DEFAULT_VENUES, Venue, venue_names
+from badminton_governor import RequestGovernor, CANCEL_ORDER_LIMIT
+from badminton_history import RunHistory
+from badminton_events import EventBus, Armed, CountdownTick, Fired, CourtResult, PaymentReady, Finished
+
+
+# 预先解析并缓存的主机地址：主机名 -> IP
+_resolved_hosts: Dict[str, str] = {}
+
+
+class _PinnedConnectionMixin:
+    """
+    使用预先解析的地址建立TCP连接，TLS的SNI和证书校验仍使用原主机名；
+    当前线程有计时记录时补充建连和发送完成的时间
+    """
+
+    def _new_conn(self):
+        address = _resolved_hosts.get(self.host)
+        sock = None
+        if address is not None:
+            try:
+                sock = urllib3_connection.create_connection(
+                    (address, self.port),
+                    self.timeout,
+                    source_address=self.source_address,
+                    socket_options=self.socket_options,
+                )
+            except OSError:
+                # 缓存地址不可用时退回常规解析
+                sock = None
+        if sock is None:
+            sock = super()._new_conn()
+        trace = current_trace()
+        if trace is not None:
+            trace["t_tcp"] = time.perf_counter()
+        return sock
+
+    def connect(self):
+        trace = current_trace()
+        if trace is not None:
+            trace["t_connect_start"] = time.perf_counter()
+        super().connect()
+        if trace is not None:
+            trace["t_connect_end"] = time.perf_counter()
+
+    def request(self, *args, **kwargs):
+        super().request(*args, **kwargs)
+        trace = current_trace()
+        if trace is not None:
+            trace["t_sent"] = time.perf_counter()
+
+
+class _TimedPoolMixin:
+    """记录从连接池取到连接的时间"""
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        trace = current_trace()
+        if trace is not None:
+            trace["t_conn"] = time.perf_counter()
+        return conn
+
+
+class _PinnedHTTPConnection(_PinnedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _PinnedHTTPSConnection(_PinnedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _PinnedHTTPConnectionPool(_TimedPoolMixin, HTTPConnectionPool):
+    ConnectionCls = _PinnedHTTPConnection
+
+
+class _PinnedHTTPSConnectionPool(_TimedPoolMixin, HTTPSConnectionPool):
+    ConnectionCls = _PinnedHTTPSConnection
+
+
+class PinnedHTTPAdapter(HTTPAdapter):
+    """
+    连接池使用预解析地址建连的适配器，设置on_trace时记录每个请求各阶段的时间，
+    设置governor时每个请求先申请限速额度，并把响应交给它判断是否被限流
+    """
+
+    def __init__(self, *args, on_trace=None, governor: Optional[RequestGovernor] = None, **kwargs):
+        self.on_trace = on_trace
+        self.governor = governor
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _PinnedHTTPConnectionPool,
+            "https": _PinnedHTTPSConnectionPool,
+        }
+
+    def send(self, request, stream=False, **kwargs):
+        if self.governor is None:
+            return self._send(request, stream, 0.0, **kwargs)
+        waited = self.governor.acquire(request.url)
+        response = self._send(request, stream, waited, **kwargs)
+        self.governor.observe(request.url, response, check_body=not stream)
+        return response
+
+    def _send(self, request, stream, waited, **kwargs):
+        if self.on_trace is None:
+            return super().send(request, stream=stream, **kwargs)
+
+        trace = {
+            "method": request.method,
+            "url": request.url,
+            "thread": threading.current_thread().name,
+            "t_queue": time.perf_counter(),
+        }
+        if waited:
+            trace["governor_wait_ms"] = waited * 1000
+        set_current_trace(trace)
+        try:
+            response = super().send(request, stream=stream, **kwargs)
+            trace["t_first_byte"] = time.perf_counter()
+            trace["status"] = response.status_code
+            if not stream:
+                response.content
+                trace["t_body"] = time.perf_counter()
+            return response
+        except Exception as e:
+            trace["error"] = str(e)
+            raise
+        finally:
+            set_current_trace(None)
+            self.on_trace(trace)
+
+
+# 下单响应分类使用的提示语关键词（按顺序匹配，未到开放时间优先）
+ORDER_NOT_OPEN_KEYWORDS = ("未到开放时间", "未开放", "尚未开始", "还未开始")
+ORDER_SOLD_KEYWORDS = ("已被预约", "已被预订", "已预约", "已满", "已锁定", "已售", "不可预约")
+ORDER_THROTTLED_KEYWORDS = ("频繁", "繁忙", "限流", "排队", "请求过多")
+# 服务器明确答复token无效时的actionState和提示语关键词；网络错误、5xx、限流等不算，不会清除缓存的会话
+TOKEN_INVALID_ACTION_STATES = (-1,)
+TOKEN_INVALID_KEYWORDS = ("登录已失效", "重新登录", "未登录")
+
+
+# 日志级别，低于BadmintonBooking.log_level的消息直接丢弃
+LOG_LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+
+class LogRecord:
+    """一条日志：完整响应等大数据放在payload里，只在需要时才格式化"""
+    __slots__ = ("created", "level", "message", "payload")
+
+    def __init__(self, created: float, level: str, message: str, payload: Any = None):
+        self.created = created
+        self.level = level
+        self.message = message
+        self.payload = payload
+
+    def format(self, with_payload: bool = False) -> str:
+        timestamp = datetime.fromtimestamp(self.created).strftime("%H:%M:%S")
+        if with_payload and self.payload is not None:
+            return f"[{timestamp}] {self.message}: {self.payload}"
+        return f"[{timestamp}] {self.message}"
+
+
+@dataclass(frozen=True)
+class BookingPlan:
+    """
+    预约计划：放票前准备好的全部数据，放票时只需按顺序发送已序列化的订单请求
+    """
+    date: str
+    time_slot: str
+    token: str
+    phone_str: str
+    # 按偏好排序的候选场地及与之一一对应的createOrderBatch请求
+    courts: Tuple[Dict[str, str], ...]
+    requests: Tuple[requests.PreparedRequest, ...]
+    # session发送请求时使用的verify/proxies/cert等设置
+    send_settings: Dict[str, Any]
+    release_at: float
+    # date之后依次接受的备选日期
+    extra_dates: Tuple[str, ...] = ()
+
+    def orders(self) -> Dict[str, requests.PreparedRequest]:
+        """场地ID -> 已准备好的订单请求"""
+        return {court["court_id"]: request for court, request in zip(self.courts, self.requests)}
+
+    def restricted_to(self, court_ids) -> "BookingPlan":
+        """只保留指定场地（保持原有偏好顺序）的新计划"""
+        keep = set(court_ids)
+        pairs = [(court, request) for court, request in zip(self.courts, self.requests)
+                 if court["court_id"] in keep]
+        return replace(self, courts=tuple(c for c, _ in pairs), requests=tuple(r for _, r in pairs))
+
+    def describe(self) -> str:
+        release = datetime.fromtimestamp(self.release_at).strftime("%H:%M:%S.%f")[:-3]
+        names = "、".join(court["court_name"] for court in self.courts)
+        return f"{self.date} {self.time_slot}，候选场地 {len(self.courts)} 个：{names}，本地放票时刻 {release}"
+
 
 class BadmintonBooking:
     def __init__(self):
@@ -16,12 +232,116 @@ class BadmintonBooking:
         self.user_id = None
         self.phone_str = None
         self.session = requests.Session()
+        # 日志前缀（多账号同时运行时用于区分）、级别，以及接收LogRecord的回调（None时直接print）
+        self.log_prefix = ""
+        self.log_level = "INFO"
+        self.log_sink = None
+        # 放票时刻（北京时间，按服务器时钟计算）及提前量
+        self.release_hour = 10
+        self.release_minute = 0
+        self.release_second = 0
+        self.release_lead_ms = 0.0
+        # 最后阶段自旋等待的时长（秒），需大于系统sleep的调度粒度
+        self.spin_window = 0.03
+        # 服务器时钟偏差（服务器时间 - 本地时间，秒）与往返时延（秒）
+        self.clock_offset = 0.0
+        self.clock_uncertainty = None
+        self.rtt = 0.0
+        # 上次校准时间，校准结果在clock_sync_ttl秒内直接复用
+        self.clock_synced_at = None
+        self.clock_sync_ttl = 600.0
+        # 并发下单：同时提交前N个候选场地（1表示逐个尝试），并发数上限
+        self.order_fanout = 1
+        self.max_order_workers = 4
+        # 对冲下单：同一订单经不同长连接发送的份数（1表示不对冲），后续各份的发送间隔（0表示同时发送），
+        # 以及取消重复订单的接口（None表示不主动取消，等待未支付订单超时释放；真实服务器的接口未经确认，默认不启用）
+        self.order_hedge = 1
+        self.hedge_delay_ms = 0.0
+        self.cancel_order_path: Optional[str] = None
+        self._hedge_executor: Optional[ThreadPoolExecutor] = None
+        self._hedge_lock = threading.Lock()
+        # 放票突发窗口：相对放票时刻的起止毫秒（None表示只在放票时刻发送一次），相邻两轮的间隔，
+        # 每秒请求数上限和整个窗口的请求总数上限
+        self.burst_window_ms: Optional[Tuple[float, float]] = (-50.0, 400.0)
+        self.burst_interval_ms = 25.0
+        self.burst_max_rate = 40.0
+        self.burst_max_requests = 12
+        # 场地偏好顺序（场地名称列表），None时按场地名称倒序
+        self.court_order: Optional[List[str]] = None
+        # 场馆目录（按偏好排序），同时查询这些场馆的余量；并发查询的线程数上限
+        self.venues: List[Venue] = list(DEFAULT_VENUES)
+        self.scan_workers = 8
+        self.scan_timeout = 3.0
+        self._scan_executor: Optional[ThreadPoolExecutor] = None
+        self._scan_lock = threading.Lock()
+        # 连接预热：放票前多少秒开始预热、预热连接数、保活间隔、放票前多少秒做最终检查
+        self.warm_lead = 60.0
+        self.warm_pool_size = 4
+        self.keepalive_interval = 15.0
+        self.verify_lead = 2.0
+        # 当前运行的时间线，设置timeline_dir后每次运行结束自动保存
+        self.timeline: Optional[RunTimeline] = None
+        self.timeline_dir = None
+        # 放票前后台轮询场地，下单时使用不超过watch_max_age秒的候选列表
+        self.watch_availability = True
+        self.watch_max_age = 1.0
+        # 捡漏模式（默认关闭）：放票失败后继续监视目标时间段，直到放票后recapture_duration秒；
+        # 未支付订单约在放票后recapture_payment_window秒超时释放，前后recapture_expiry_spread秒内轮询最快
+        self.recapture = False
+        self.recapture_duration = 1800.0
+        self.recapture_payment_window = 600.0
+        self.recapture_expiry_spread = 60.0
+        # 支付二维码：按URL缓存的PNG、后台生成线程，qr_save_path非空时同时保存为文件
+        self.qr_save_path = None
+        self._qr_cache: Dict[Tuple[str, int], bytes] = {}
+        self._qr_lock = threading.Lock()
+        self._qr_executor: Optional[ThreadPoolExecutor] = None
+        # 本地会话缓存（None时不持久化），当前会话对应的手机号和过期时刻
+        self.session_store: Optional[SessionStore] = None
+        self.session_phone = None
+        self.session_expires_at = None
+        # 最近一次确认token有效的时刻，session_validation_ttl秒内准备预约时不再重复校验
+        self.session_validated_at = None
+        self.session_validation_ttl = 300.0
+        # 恢复缓存的会话时校验请求的尝试次数和间隔（秒），网络暂时不通时重试
+        self.session_check_attempts = 3
+        self.session_check_retry_delay = 2.0
+        # 距离过期不足session_refresh_margin秒时续期（或提醒重新登录）
+        self.session_refresh_margin = 24 * 3600.0
+        # 所有请求经过的客户端限速器；放票窗口从最终连接检查开始，到突发窗口结束后governor_window_tail秒为止，
+        # 窗口内的下单请求使用单独的预算
+        self.governor = RequestGovernor(throttle_keywords=ORDER_THROTTLED_KEYWORDS)
+        self.governor_window_tail = 2.0
+        # 放票运行历史（None时不记录）；auto_tune为True时每次放票前按历史调整提前量和并发数
+        self.history: Optional[RunHistory] = None
+        self.auto_tune = True
+        # 本次运行发出的下单请求：(发送时刻, 收到响应时刻, 请求体, 服务器Date头, 结果)，只在记录历史时收集
+        self.order_attempts: Optional[List[tuple]] = None
+        # 进度事件（None时不发出），订阅者在下单等线程中被调用
+        self.events: Optional[EventBus] = None
+        self._mount_adapter(self.warm_pool_size)
     
-    def log_message(self, message):
-        """添加日志消息"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        log_entry = f"[{timestamp}] {message}"
-        print(log_entry)
+    def log_message(self, message, level: str = "INFO", payload: Any = None):
+        """添加日志消息，payload只在调试级别下才格式化输出"""
+        if LOG_LEVELS[level] < LOG_LEVELS[self.log_level]:
+            return
+        record = LogRecord(time.time(), level, f"{self.log_prefix}{message}", payload)
+        if self.log_sink is not None:
+            self.log_sink(record)
+        else:
+            print(record.format(self.log_level == "DEBUG"))
+
+    def _emit(self, event: Any):
+        if self.events is not None:
+            self.events.emit(event)
+
+    @staticmethod
+    def _brief(result: Dict[str, Any]) -> str:
+        """响应的简要信息，完整内容作为payload按需输出"""
+        brief = f"actionState={result.get('actionState')}"
+        if result.get("msg"):
+            brief += f" {result['msg']}"
+        return brief
         
     def send_sms_code(self, phone: str) -> Dict[str, Any]:
         """
@@ -35,10 +355,10 @@ class BadmintonBooking:
         try:
             response = self.session.post(url, data=data)
             result = response.json()
-            self.log_message(f"发送验证码结果: {result}")
+            self.log_message(f"发送验证码结果: {self._brief(result)}", payload=result)
             return result
         except Exception as e:
-            self.log_message(f"发送验证码失败: {e}")
+            self.log_message(f"发送验证码失败: {e}", level="ERROR")
             return {"error": str(e)}
     
     def login_with_sms(self, phone: str, sms_code: str, open_id: str = "") -> Dict[str, Any]:
@@ -61,36 +381,196 @@ class BadmintonBooking:
                 self.user_id = result["data"].get("userId")
                 # 设置后续请求的token，使用大写的Token
                 self.session.headers.update({"Token": self.token})
+                self.session_phone = phone
+                self.session_validated_at = time.time()
+                self.save_session()
 
-            self.log_message(f"登录结果: {result}")
+            self.log_message(f"登录结果: {self._brief(result)}", payload=result)
             return result
         except Exception as e:
-            self.log_message(f"登录失败: {e}")
+            self.log_message(f"登录失败: {e}", level="ERROR")
             return {"error": str(e)}
     
+    def save_session(self):
+        """把当前会话写入本地缓存"""
+        if self.session_store is None or not self.session_phone or not self.token:
+            return
+        try:
+            entry = self.session_store.save(self.session_phone, self.token, self.user_id, self.phone_str,
+                                            expires_at=self.session_expires_at)
+            self.session_expires_at = entry["expires_at"]
+        except Exception as e:
+            self.log_message(f"保存会话失败: {e}", level="WARNING")
+
+    def restore_session(self, phone: str) -> bool:
+        """
+        从本地缓存恢复某手机号的会话，并用一次实名信息查询确认token仍然有效
+        """
+        if self.session_store is None:
+            return False
+        entry = self.session_store.load(phone)
+        if entry is None:
+            return False
+
+        self.token = entry["token"]
+        self.user_id = entry["user_id"]
+        self.phone_str = entry.get("phone_str")
+        self.session_phone = phone
+        self.session_expires_at = entry["expires_at"]
+        self.session.headers.update({"Token": self.token})
+
+        for attempt in range(self.session_check_attempts):
+            if attempt:
+                time.sleep(self.session_check_retry_delay)
+            result = self.get_user_verified_info()
+            if self.is_session_verified(result):
+                self.log_message(f"已恢复缓存的会话 {phone}")
+                return True
+            if self.is_token_rejected(result):
+                self.log_message("缓存的会话已失效，需要重新短信登录", level="WARNING")
+                self.session_store.clear(phone)
+                break
+        else:
+            # 只是暂时无法确认（网络错误、服务器故障），保留缓存，下次再试
+            self.log_message("暂时无法校验缓存的会话，保留缓存稍后重试", level="WARNING")
+
+        self.token = self.user_id = self.phone_str = None
+        self.session_phone = self.session_expires_at = None
+        self.session.headers.pop("Token", None)
+        return False
+
+    @staticmethod
+    def is_session_verified(result: Dict[str, Any]) -> bool:
+        """实名信息查询是否确认了token有效"""
+        return result.get("actionState") == 1 and "data" in result
+
+    @staticmethod
+    def is_token_rejected(result: Dict[str, Any]) -> bool:
+        """服务器是否明确答复token无效（请求失败、无法解析的响应都不算）"""
+        if "error" in result or result.get("actionState") == 1:
+            return False
+        message = str(result.get("msg") or result.get("message") or "")
+        return (result.get("actionState") in TOKEN_INVALID_ACTION_STATES
+                or any(keyword in message for keyword in TOKEN_INVALID_KEYWORDS))
+
+    def session_is_validated(self) -> bool:
+        """token是否在session_validation_ttl秒内确认过有效"""
+        return (self.session_validated_at is not None
+                and time.time() - self.session_validated_at < self.session_validation_ttl)
+
+    def refresh_session_if_needed(self) -> bool:
+        """
+        会话临近过期时重新校验：token不带过期时间时校验成功即顺延有效期；
+        JWT的过期时间由服务器决定，只能提醒重新短信登录。返回当前会话是否可用
+        """
+        if not self.token:
+            return False
+        if self.session_expires_at is not None and \
+                self.session_expires_at - time.time() > self.session_refresh_margin:
+            return True
+
+        # 按本次校验的结果判断，不看之前留下的session_validated_at
+        result = self.get_user_verified_info()
+        if self.is_token_rejected(result):
+            self.log_message("会话已失效，请重新短信登录", level="WARNING")
+            return False
+        if not self.is_session_verified(result):
+            self.log_message("暂时无法校验会话，稍后重试", level="WARNING")
+            return True
+        expiry = token_expiry(self.token)
+        if expiry is None:
+            self.session_expires_at = None
+            self.save_session()
+            self.log_message("会话已续期")
+        else:
+            expires = datetime.fromtimestamp(expiry).strftime("%m-%d %H:%M")
+            self.log_message(f"会话将于 {expires} 过期，请在此之前重新短信登录", level="WARNING")
+        return True
+
+    def availability_url(self, date: str, space_id: str = "111162", sport_type: str = "2") -> str:
+        """场地余量接口的URL"""
+        # 参数直接放在URL中，就像Postman的curl命令一样
+        return f"{self.base_url}/open/getSpaceOrderDetailsNew?spaceId={space_id}&sportType={sport_type}&time={date}"
+
     def get_available_courts(self, date: str, space_id: str = "111162", sport_type: str = "2") -> Dict[str, Any]:
         """
         步骤3: 获取指定日期的可预约场地
         """
-        # 参数直接放在URL中，就像Postman的curl命令一样
-        url = f"{self.base_url}/open/getSpaceOrderDetailsNew?spaceId={space_id}&sportType={sport_type}&time={date}"
+        url = self.availability_url(date, space_id, sport_type)
 
         try:
             # 使用POST请求，直接使用session的headers
             response = self.session.post(url)
             
             if response.status_code == 200:
-                result = response.json()
-                self.log_message(f"可预约场地: {result}")
+                # 场地数据量大：直接解码响应字节，完整内容只在调试级别下才格式化
+                result = decode_json(response.content)
+                self.log_message(f"可预约场地: {self._brief(result)}", payload=result)
                 return result
             else:
-                self.log_message(f"响应内容: {response.text}")
+                self.log_message(f"获取场地信息失败: HTTP {response.status_code}", level="ERROR", payload=response.text)
                 return {"error": f"HTTP {response.status_code}: {response.text}"}
                 
         except Exception as e:
-            self.log_message(f"获取场地信息失败: {e}")
+            self.log_message(f"获取场地信息失败: {e}", level="ERROR")
             return {"error": str(e)}
     
+    def fetch_availability(self, date: str, venue: Venue,
+                           session: Optional[requests.Session] = None) -> Dict[str, Any]:
+        """获取一个场馆一个日期的场地余量，不输出日志（由调用方汇总）"""
+        url = self.availability_url(date, venue.space_id, venue.sport_type)
+        try:
+            response = (session or self.session).post(url, timeout=self.scan_timeout)
+            if response.status_code != 200:
+                return {"error": f"HTTP {response.status_code}"}
+            return decode_json(response.content)
+        except Exception as e:
+            return {"error": str(e)}
+
+    def scan_availability(self, dates: List[str], venues: Optional[List[Venue]] = None,
+                          session: Optional[requests.Session] = None,
+                          model: Optional[Availability] = None) -> Dict[str, Any]:
+        """
+        同时获取多个场馆、多个日期的场地余量：所有请求经同一个连接池并发发出，总耗时约为一次往返，
+        结果合并到同一个场地模型中（传入model时增量更新）。
+        返回availability（场地模型）、changed（变化的场地ID）、errors（失败的场馆和日期）和elapsed_ms
+        """
+        venues = venues or self.venues
+        model = model if model is not None else Availability()
+        combos = [(date, venue) for date in dates for venue in venues]
+        start = time.perf_counter()
+        if len(combos) == 1:
+            results = [self.fetch_availability(combos[0][0], combos[0][1], session)]
+        else:
+            with self._scan_lock:
+                if self._scan_executor is None:
+                    self._scan_executor = ThreadPoolExecutor(max_workers=self.scan_workers,
+                                                             thread_name_prefix="scan")
+                executor = self._scan_executor
+            futures = [executor.submit(self.fetch_availability, date, venue, session) for date, venue in combos]
+            results = [future.result() for future in futures]
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        changed = []
+        errors = []
+        for (date, venue), result in zip(combos, results):
+            if "error" in result:
+                errors.append({"date": date, "venue": venue.space_id, "error": result["error"]})
+            elif "data" not in result:
+                errors.append({"date": date, "venue": venue.space_id, "error": result.get("msg", "未知错误")})
+            else:
+                changed.extend(model.update(result, date, venue.space_id))
+        return {"availability": model, "changed": changed, "errors": errors, "elapsed_ms": elapsed_ms}
+
+    def court_label(self, court: Dict[str, str]) -> str:
+        """候选场地的显示名称，查询多个场馆或多个日期时带上场馆名称和日期"""
+        label = f"{court['slice_time']} {court['court_name']}"
+        if "venue" in court:
+            if len(self.venues) > 1:
+                label = f"{venue_names(self.venues).get(court['venue'], court['venue'])} {label}"
+            label = f"{court['date']} {label}"
+        return label
+
     def get_user_verified_info(self) -> Dict[str, Any]:
         """
         步骤4: 获取用户实名认证信息
@@ -101,18 +581,22 @@ class BadmintonBooking:
             response = self.session.post(url)
             result = response.json()
             
-            if result.get("actionState") == 1 and "data" in result:
+            if self.is_session_verified(result):
                 self.phone_str = result["data"].get("phonestr")
+                self.session_validated_at = time.time()
+                self.save_session()
+            else:
+                self.session_validated_at = None
 
-            self.log_message(f"用户认证信息: {result}")
+            self.log_message(f"用户认证信息: {self._brief(result)}", payload=result)
             return result
         except Exception as e:
-            self.log_message(f"获取用户信息失败: {e}")
+            self.log_message(f"获取用户信息失败: {e}", level="ERROR")
             return {"error": str(e)}
     
-    def create_order(self, court_id: str) -> Dict[str, Any]:
+    def build_order_request(self, court_id: str) -> requests.PreparedRequest:
         """
-        步骤5: 创建预约订单
+        构造并序列化指定场地的createOrderBatch请求，放票时可直接发送
         """
         url = f"{self.base_url}/order/createOrderBatch"
         
@@ -126,38 +610,148 @@ class BadmintonBooking:
             "fullPath": f"http://kfxy.ruizhiedu.com/#/pages/space/orderBatch?openid={court_id}"
         }
         
+        return self.session.prepare_request(requests.Request("POST", url, json=order_data))
+
+    def _send_settings(self) -> Dict[str, Any]:
+        """session发请求时合并的环境设置（verify/proxies/cert等）"""
+        return self.session.merge_environment_settings(self.base_url, {}, None, None, None)
+
+    def send_order(self, prepared: requests.PreparedRequest,
+                   send_settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        发送已准备好的订单请求
+        """
+        if send_settings is None:
+            send_settings = self._send_settings()
+        # 上一次运行尚未返回的请求仍记入它自己的列表
+        attempts = self.order_attempts
+        response = None
+        sent_at = time.time()
         try:
-            response = self.session.post(url, json=order_data)
+            response = self.session.send(prepared, **send_settings)
+            if response.status_code == 429:
+                self.log_message("创建订单被限流: HTTP 429", level="WARNING")
+                result = {"error": "请求过于频繁 (HTTP 429)", "status_code": 429}
+            else:
+                result = response.json()
+                self.log_message(f"创建订单结果: {self._brief(result)}", payload=result)
+        except Exception as e:
+            self.log_message(f"创建订单失败: {e}", level="ERROR")
+            result = {"error": str(e)}
+        if attempts is not None:
+            attempts.append((sent_at, time.time(), prepared.body,
+                                        response.headers.get("Date") if response is not None else None, result))
+        return result
+
+    def create_order(self, court_id: str) -> Dict[str, Any]:
+        """
+        步骤5: 创建预约订单
+        """
+        return self._send_prepared_order(self.build_order_request(court_id))
+
+    def _send_prepared_order(self, prepared: requests.PreparedRequest,
+                             send_settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        if self.order_hedge > 1:
+            return self.send_order_hedged(prepared, send_settings)
+        return self.send_order(prepared, send_settings)
+
+    def send_order_hedged(self, prepared: requests.PreparedRequest,
+                          send_settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        对冲下单：同一订单经不同的长连接发送order_hedge份。hedge_delay_ms为0时同时发送，
+        否则前面的请求超过该时间仍未返回才发送下一份。最先返回的成功响应即为结果，
+        其余各份稍后返回的成功订单视为重复订单并取消；全部失败时返回第一个非异常的响应
+        """
+        if send_settings is None:
+            send_settings = self._send_settings()
+        with self._hedge_lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(
+                    max_workers=max(self.max_order_workers * self.order_hedge, self.burst_max_requests),
+                    thread_name_prefix="hedge")
+        executor = self._hedge_executor
+
+        # 连接池中空闲的长连接各取一个，并发的各份请求自然走不同的连接
+        futures = []
+        for copy in range(self.order_hedge):
+            futures.append(executor.submit(self.send_order, prepared.copy(), send_settings))
+            if copy == self.order_hedge - 1 or self.hedge_delay_ms <= 0:
+                continue
+            done, _ = wait(futures, timeout=self.hedge_delay_ms / 1000, return_when=FIRST_COMPLETED)
+            # 已经得到服务器的明确答复时不再对冲
+            if any("error" not in future.result() for future in done):
+                break
+
+        results = []
+        winner = None
+        pending = set(futures)
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results.append(future.result())
+                if winner is None and self.is_order_success(results[-1]):
+                    winner = results[-1]
+
+        if winner is None:
+            return next((result for result in results if "error" not in result), results[0])
+
+        for result in results:
+            if result is not winner:
+                self.release_duplicate_order(result, winner)
+        for future in pending:
+            future.add_done_callback(lambda f: self.release_duplicate_order(f.result(), winner))
+        return winner
+
+    def release_duplicate_order(self, order_result: Dict[str, Any], kept: Optional[Dict[str, Any]] = None):
+        """
+        order_result是与保留的订单kept不同的成功订单时，作为重复订单取消
+        """
+        if not self.is_order_success(order_result):
+            return
+        order = order_result["data"]
+        if kept is not None and order.get("orderId") == kept["data"].get("orderId"):
+            return
+        self.log_message(f"检测到重复订单 {order.get('orderId')}，尝试取消", level="WARNING")
+        self.cancel_order(order)
+
+    def cancel_order(self, order: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        取消未支付的订单；未配置取消接口时只提示等待订单超时释放
+        """
+        if not self.cancel_order_path:
+            self.log_message("未配置取消订单接口，未支付的重复订单将自动释放")
+            return {"error": "未配置取消订单接口"}
+        try:
+            response = self.session.post(f"{self.base_url}{self.cancel_order_path}",
+                                         data={"orderId": order.get("orderId")}, timeout=5)
             result = response.json()
-            self.log_message(f"创建订单结果: {result}")
+            self.log_message(f"取消订单结果: {self._brief(result)}", payload=result)
             return result
         except Exception as e:
-            self.log_message(f"创建订单失败: {e}")
+            self.log_message(f"取消订单失败: {e}，未支付的重复订单将自动释放", level="WARNING")
             return {"error": str(e)}
     
-    def find_available_courts_by_time(self, courts_data: Dict[str, Any], time_slot: str) -> List[Dict[str, str]]:
+    def find_available_courts_by_time(self, courts_data: Dict[str, Any], time_slot: str,
+                                      date: str = "") -> List[Dict[str, str]]:
         """
-        根据时间段查找所有可用场地，按场地名称倒序排列
+        根据时间段查找所有可用场地；time_slot可用逗号分隔多个备选时间段，靠前优先，
+        同一时间段内按court_order排序，未指定时按场地名称倒序排列
         """
-        if "data" not in courts_data or "openSlice" not in courts_data["data"]:
-            return []
-            
-        open_slice = courts_data["data"]["openSlice"]
-        available_courts = []
-        
-        for court_id, court_info in open_slice.items():
-            if (court_info.get("slice_time") == time_slot and
-                court_info.get("is_lock") != 1):
-                available_courts.append({
-                    "court_id": court_id,
-                    "court_name": court_info.get("slice_name", "")
-                })
-        
-        # 按场地名称倒序排列
-        available_courts.sort(key=lambda x: x["court_name"], reverse=True)
-        return available_courts
+        availability = Availability.from_response(courts_data, date, parse_time_slots(time_slot))
+        return self.select_courts(availability, date, time_slot)
 
-    def complete_booking_process(self, phone: str, sms_code: str, date: str, time_slot: str) -> Dict[str, Any]:
+    def select_courts(self, availability: Availability, date: str, time_slot: str,
+                      extra_dates: Tuple[str, ...] = ()) -> List[Dict[str, str]]:
+        """
+        从场地模型中按日期、时间段、场馆和场地的偏好依次选出候选场地
+        """
+        venue_order = [venue.space_id for venue in self.venues] if len(self.venues) > 1 else None
+        courts = availability.query_dates((date,) + tuple(extra_dates), parse_time_slots(time_slot),
+                                          self.court_order, venue_order=venue_order)
+        return [court.as_candidate() for court in courts]
+
+    def complete_booking_process(self, phone: str, sms_code: str, date: str, time_slot: str,
+                                 on_armed=None, extra_dates: Tuple[str, ...] = ()) -> Dict[str, Any]:
         """
         完整的预约流程
         """
@@ -167,33 +761,230 @@ class BadmintonBooking:
 #         if "error" in login_result or not self.token:
 #             return login_result
 
-#         步骤3: 获取用户认证信息
-        self.log_message("步骤3: 获取用户认证信息")
-        user_info_result = self.get_user_verified_info()
-        if "error" in user_info_result or not self.phone_str:
-            return user_info_result
-
-        # 步骤4: 获取可预约场地
-        self.log_message("步骤4: 获取可预约场地")
-        courts_result = self.get_available_courts(date)
-        if "error" in courts_result:
-            return courts_result
-        
-        # 查找符合时间段的所有可用场地，按名称倒序
-        available_courts = self.find_available_courts_by_time(courts_result, time_slot)
+#         步骤3-4: 放票前准备预约计划
+        self.timeline = RunTimeline()
+        self.governor.reset_counters()
+        self.apply_tuning()
+        self.order_attempts = [] if self.history is not None else None
+        with self._phase("arm"):
+            armed = self.arm(date, time_slot, extra_dates)
+        if "error" in armed:
+            self._emit(Finished(armed))
+            return armed
+        plan = armed["plan"]
+        self.timeline.target = plan.release_at
+        if on_armed is not None:
+            on_armed(plan)
+
+        # 等待到放票时刻
+        self.log_message(f"⏰ 等待北京时间 {self.release_hour:02d}:{self.release_minute:02d}:{self.release_second:02d} 开始抢票...")
+        watcher = None
+        if self.watch_availability:
+            watcher = AvailabilityWatcher(self, plan.date, plan.time_slot, plan.release_at,
+                                          extra_dates=plan.extra_dates).start()
+        with self._phase("warm"):
+            release_at = self.prepare_connections(plan.release_at)
+        if release_at != plan.release_at:
+            plan = replace(plan, release_at=release_at)
+            self.timeline.target = release_at
+            if watcher is not None:
+                watcher.release_at = release_at
+        with self._phase("wait"):
+            trigger = self.wait_until_release(plan.release_at)
+        self.timeline.add("trigger", "release", send_at=trigger["send_at"], error_ms=trigger["error_ms"])
+        self._emit(Fired(trigger["send_at"], trigger["error_ms"]))
+
+        courts = watcher.fresh_candidates(self.watch_max_age) if watcher is not None else None
+        with self._phase("fire"):
+            result = self.fire(plan, courts)
+        if watcher is not None:
+            watcher.stop()
+        self.log_request_budget()
+        self.record_run(plan, result, trigger["error_ms"])
+        if self.recapture and not result.get("success"):
+            with self._phase("recapture"):
+                result = self.recapture_courts(plan)
+        self._emit(Finished(result))
+        if self.timeline_dir:
+            self.save_timeline()
+        return result
+
+    def arm(self, date: str, time_slot: str, extra_dates: Tuple[str, ...] = ()) -> Dict[str, Any]:
+        """
+        放票前的全部准备：校验token、获取场地、排序候选场地、预先构造订单请求、校准时钟；
+        场地同时从所有场馆（及extra_dates中的备选日期）中选取
+        """
+        # 步骤3: 获取用户认证信息（同时验证token有效），刚校验过的会话直接使用
+        if self.phone_str and self.session_is_validated():
+            self.log_message("步骤3: 会话刚校验过，跳过获取用户认证信息")
+        else:
+            self.log_message("步骤3: 获取用户认证信息")
+            user_info_result = self.get_user_verified_info()
+            if "error" in user_info_result:
+                return user_info_result
+            if not self.session_validated_at or not self.phone_str:
+                return {"error": user_info_result.get("msg") or "用户认证失败"}
+
+        # 步骤4: 同时获取所有场馆、所有日期的可预约场地
+        extra_dates = tuple(extra_dates)
+        dates = [date, *extra_dates]
+        self.log_message(f"步骤4: 获取可预约场地（{len(self.venues)} 个场馆 × {len(dates)} 个日期）")
+        scan = self.scan_availability(dates)
+        for failure in scan["errors"]:
+            self.log_message(f"获取场地信息失败: {failure['date']} 场馆{failure['venue']}: {failure['error']}",
+                             level="ERROR")
+        if len(scan["errors"]) == len(dates) * len(self.venues):
+            return {"error": scan["errors"][0]["error"]}
+        self.log_message(f"场地余量查询耗时: {scan['elapsed_ms']:.1f} ms")
+
+        # 查找符合时间段的所有可用场地，按偏好排序
+        available_courts = self.select_courts(scan["availability"], date, time_slot, extra_dates)
         if not available_courts:
             return {"error": f"未找到时间段：{time_slot} 的可用场地"}
         
-        self.log_message(f"找到 {len(available_courts)} 个可用场地，按名称倒序：")
-        for court in available_courts:
-            self.log_message(f"  - {court['court_name']} (ID: {court['court_id']})")
-        
-            # 等待到北京时间上午10:00整
-        self.log_message("⏰ 等待北京时间上午10:00整开始抢票...")
-        self.wait_until_10am_beijing()
-        
-        # 轮询尝试预约，从名称倒序的第一个开始
+        self.log_message(f"找到 {len(available_courts)} 个可用场地，按偏好顺序：")
         for court in available_courts:
+            self.log_message(f"  - {self.court_label(court)} (ID: {court['court_id']})")
+
+        if self.clock_synced_at is None or time.time() - self.clock_synced_at > self.clock_sync_ttl:
+            self.log_message("校准服务器时钟...")
+            self.sync_server_clock()
+
+        plan = BookingPlan(
+            date=date,
+            time_slot=time_slot,
+            token=self.token,
+            phone_str=self.phone_str,
+            courts=tuple(available_courts),
+            requests=tuple(self.build_order_request(court["court_id"]) for court in available_courts),
+            send_settings=self._send_settings(),
+            release_at=self.get_release_target(),
+            extra_dates=extra_dates
+        )
+        self.log_message(f"预约计划已就绪: {plan.describe()}")
+        self._emit(Armed(plan.date, plan.time_slot, plan.release_at, self._send_start(plan.release_at),
+                         plan.courts, plan.describe()))
+        return {"success": True, "plan": plan}
+
+    def fire(self, plan: BookingPlan, courts: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
+        """
+        放票时刻发送预约计划中已准备好的订单请求；courts为后台轮询得到的最新候选列表时优先使用
+        """
+        orders = plan.orders()
+        courts = list(plan.courts) if courts is None else courts
+        fire_start = time.perf_counter()
+
+        if self.burst_window_ms is not None:
+            self.log_message("步骤5: 在放票窗口内分批提交预约订单")
+            retired = set()
+            result = self.create_orders_burst(courts, orders, plan.send_settings, plan.release_at, retired)
+            # 窗口内没有成功时，在放票时刻之后逐个尝试还没有明确失败的场地
+            remaining = [court for court in courts if court["court_id"] not in retired]
+            if not result.get("success") and remaining:
+                self.log_message(f"放票窗口内未能预约成功，继续尝试其余 {len(remaining)} 个场地")
+                self._sleep_until(self._send_base(plan.release_at))
+                result = self.submit_orders(remaining, orders, plan.send_settings)
+            self.log_message(f"下单耗时: {(time.perf_counter() - fire_start) * 1000:.1f} ms")
+            return result
+
+        result = self.submit_orders(courts, orders, plan.send_settings)
+        self.log_message(f"下单耗时: {(time.perf_counter() - fire_start) * 1000:.1f} ms")
+        return result
+
+    def submit_orders(self, courts: List[Dict[str, str]],
+                      orders: Optional[Dict[str, requests.PreparedRequest]] = None,
+                      send_settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        先并发提交前N个场地，失败后再逐个尝试剩余场地
+        """
+        result = None
+        fanout = min(self.order_fanout, len(courts))
+        if fanout > 1:
+            self.log_message(f"步骤5: 并发提交前 {fanout} 个场地的预约订单")
+            result = self.create_orders_concurrently(courts[:fanout], orders, send_settings)
+            courts = courts[fanout:]
+
+        if result is None or not result.get("success"):
+            result = self.create_orders_sequentially(courts, orders, send_settings)
+        return result
+
+    def recapture_courts(self, plan: BookingPlan, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """
+        放票失败后继续监视计划的(日期, 时间段)，场地因订单超时未支付重新释放时立即下单，
+        到deadline（默认放票后recapture_duration秒）为止
+        """
+        if deadline is None:
+            deadline = plan.release_at + self.recapture_duration
+        self.log_message(f"进入捡漏模式: 监视 {plan.date} {plan.time_slot} 至 "
+                         f"{datetime.fromtimestamp(deadline).strftime('%H:%M:%S')}")
+        watcher = RecaptureWatcher(self, plan, deadline, self.recapture_payment_window,
+                                   self.recapture_expiry_spread)
+        result = watcher.run()
+        if "error" in result:
+            self.log_message(result["error"])
+        return result
+
+    def _submit_order(self, court: Dict[str, str],
+                      orders: Optional[Dict[str, requests.PreparedRequest]],
+                      send_settings: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """优先发送预先准备好的请求，没有时现场构造"""
+        start = time.perf_counter()
+        if orders and court["court_id"] in orders:
+            order_result = self._send_prepared_order(orders[court["court_id"]], send_settings)
+        else:
+            order_result = self.create_order(court["court_id"])
+        if self.events is not None:
+            message = str(order_result.get("error") or order_result.get("msg") or "")
+            self.events.emit(CourtResult(court["court_id"], court["court_name"], court.get("slice_time", ""),
+                                         self.classify_order_result(order_result), message,
+                                         (time.perf_counter() - start) * 1000))
+        return order_result
+
+    @staticmethod
+    def is_order_success(order_result: Dict[str, Any]) -> bool:
+        """判断下单结果是否包含支付二维码URL"""
+        return (order_result.get("actionState") == 1 and
+                "data" in order_result and
+                "codeUrl" in order_result["data"])
+
+    @classmethod
+    def classify_order_result(cls, order_result: Dict[str, Any]) -> str:
+        """
+        下单结果分类：success成功，not_open未到开放时间，sold场地已被预约，throttled被限流，error其他错误
+        """
+        if cls.is_order_success(order_result):
+            return "success"
+        if "error" in order_result:
+            return "throttled" if order_result.get("status_code") == 429 else "error"
+        message = str(order_result.get("msg") or order_result.get("message") or "")
+        for status, keywords in (("not_open", ORDER_NOT_OPEN_KEYWORDS), ("sold", ORDER_SOLD_KEYWORDS),
+                                 ("throttled", ORDER_THROTTLED_KEYWORDS)):
+            if any(keyword in message for keyword in keywords):
+                return status
+        return "error"
+
+    def _booking_success(self, court: Dict[str, str], order_result: Dict[str, Any]) -> Dict[str, Any]:
+        """组装预约成功结果，供GUI使用"""
+        code_url = order_result["data"]["codeUrl"]
+        self.log_message(f"步骤6: 获取支付二维码URL: {code_url}")
+        self._emit(PaymentReady(court["court_id"], court["court_name"], code_url))
+
+        return {
+            "success": True,
+            "message": f"预约成功 - 场地：{court['court_name']}",
+            "court_name": court["court_name"],
+            "time_slot": court.get("slice_time"),
+            "payment_url": code_url,
+            "order_info": order_result["data"]
+        }
+
+    def create_orders_sequentially(self, courts: List[Dict[str, str]],
+                                   orders: Optional[Dict[str, requests.PreparedRequest]] = None,
+                                   send_settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        按偏好顺序逐个尝试预约，任一成功即返回
+        """
+        for court in courts:
             court_id = court["court_id"]
             court_name = court["court_name"]
             
@@ -201,24 +992,12 @@ class BadmintonBooking:
             
             # 步骤5: 创建订单
             self.log_message("步骤5: 创建预约订单")
-            order_result = self.create_order(court_id)
+            order_result = self._submit_order(court, orders, send_settings)
             
             if "error" not in order_result:
                 # 步骤6: 获取支付二维码URL
-                if (order_result.get("actionState") == 1 and
-                    "data" in order_result and
-                    "codeUrl" in order_result["data"]):
-                    
-                    code_url = order_result["data"]["codeUrl"]
-                    self.log_message(f"步骤6: 获取支付二维码URL: {code_url}")
-                    
-                    return {
-                        "success": True,
-                        "message": f"预约成功 - 场地：{court_name}",
-                        "court_name": court_name,
-                        "payment_url": code_url,
-                        "order_info": order_result["data"]
-                    }
+                if self.is_order_success(order_result):
+                    return self._booking_success(court, order_result)
                 else:
                     self.log_message(f"场地 {court_name} 预约失败，尝试下一个场地")
                     continue
@@ -228,71 +1007,726 @@ class BadmintonBooking:
         
         return {"error": "所有可用场地预约都失败了"}
 
-    def generate_qr_code(self, payment_url: str, filename: str = "payment_qr.png") -> str:
+    def create_orders_concurrently(self, courts: List[Dict[str, str]],
+                                   orders: Optional[Dict[str, requests.PreparedRequest]] = None,
+                                   send_settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        同时向多个候选场地提交订单，任一成功即停止其余尝试；
+        多个成功时按偏好顺序（列表顺序）选取
+        """
+        stop_event = threading.Event()
+
+        def attempt(court):
+            # 已有场地成功时，尚未发出的请求直接放弃
+            if stop_event.is_set():
+                return None
+            order_result = self._submit_order(court, orders, send_settings)
+            if self.is_order_success(order_result):
+                stop_event.set()
+            return order_result
+
+        executor = ThreadPoolExecutor(max_workers=max(1, min(self.max_order_workers, len(courts))))
+        futures = {executor.submit(attempt, court): rank for rank, court in enumerate(courts)}
+        pending = set(futures)
+        best_rank = None
+        results = {}
+
+        try:
+            while pending:
+                # 已有成功结果时，只需等待偏好更高且已发出的请求
+                if best_rank is not None:
+                    pending = {f for f in pending if futures[f] < best_rank and not f.cancel()}
+                    if not pending:
+                        break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    rank = futures[future]
+                    order_result = future.result()
+                    if order_result is None:
+                        continue
+                    results[rank] = order_result
+                    if self.is_order_success(order_result):
+                        if best_rank is None or rank < best_rank:
+                            best_rank = rank
+                    else:
+                        court = courts[rank]
+                        reason = order_result.get("error", order_result.get("msg", "未知错误"))
+                        self.log_message(f"场地 {court['court_name']} 预约失败：{reason}")
+        finally:
+            # 不等待较低偏好的在途请求，未开始的直接取消
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        if best_rank is None:
+            return {"error": "所有可用场地预约都失败了"}
+
+        winner = results[best_rank]
+        for rank, order_result in results.items():
+            if rank != best_rank:
+                self._handle_late_order(courts[rank], order_result, winner)
+        # 未读取结果的在途请求返回后再处理，它们抢到的订单同样作为重复订单取消
+        for future, rank in futures.items():
+            if rank not in results and not future.cancelled():
+                future.add_done_callback(
+                    lambda f, court=courts[rank]: self._handle_late_order(
+                        court, f.result() if not f.cancelled() and f.exception() is None else None, winner))
+
+        return self._booking_success(courts[best_rank], winner)
+
+    def _handle_late_order(self, court: Dict[str, str], order_result: Optional[Dict[str, Any]],
+                           kept: Optional[Dict[str, Any]]):
+        """
+        选定订单之后才处理的下单结果：成功的订单作为重复订单取消；还没有选定订单时只提示支付链接
+        """
+        if order_result is None or not self.is_order_success(order_result):
+            return
+        if kept is None:
+            self.log_message(f"场地 {court['court_name']} 在下单结束后才返回成功，"
+                             f"支付链接: {order_result['data']['codeUrl']}", level="WARNING")
+            return
+        self.log_message(f"场地 {court['court_name']} 也预约成功")
+        self.release_duplicate_order(order_result, kept)
+
+    def create_orders_burst(self, courts: List[Dict[str, str]],
+                            orders: Optional[Dict[str, requests.PreparedRequest]] = None,
+                            send_settings: Optional[Dict[str, Any]] = None,
+                            target: Optional[float] = None, retired: Optional[set] = None) -> Dict[str, Any]:
         """
-        生成支付二维码
+        在放票时刻前后的窗口内分批错开提交订单：每轮向前N个（order_fanout）仍可尝试的场地各发一个请求，
+        不等上一轮返回；未到开放时间的场地下一轮继续尝试，被限流时拉长间隔；已售出的场地跳过，
+        放票时刻之后收到的其他失败响应（提示语无法识别）也改试下一个场地。
+        任一成功即停止，请求总数不超过burst_max_requests；retired非空时记录不再尝试的场地ID
         """
+        if target is None:
+            target = self.get_release_target()
+        start_ms, end_ms = self.burst_window_ms
+        width = max(1, min(self.order_fanout, len(courts)))
+        interval = max(self.burst_interval_ms, 1000.0 * width / self.burst_max_rate) / 1000
+        # 已错过窗口开始时从现在起计算窗口
+        base = max(self._send_base(target), time.time() - start_ms / 1000)
+        wave_at = base + start_ms / 1000
+        deadline = base + end_ms / 1000
+
+        stop_event = threading.Event()
+        responses: "queue.Queue[Tuple[int, Dict[str, Any]]]" = queue.Queue()
+        # 窗口结束（closed）后才返回的请求由发送线程自己处理，抢到的订单作为重复订单取消
+        late_lock = threading.Lock()
+        closed = False
+
+        def attempt(rank):
+            if stop_event.is_set():
+                responses.put((rank, None))
+                return
+            try:
+                order_result = self._submit_order(courts[rank], orders, send_settings)
+            except Exception as e:
+                order_result = {"error": str(e)}
+            with late_lock:
+                if not closed:
+                    responses.put((rank, order_result))
+                    return
+            self._handle_late_order(courts[rank], order_result, winner[1] if winner is not None else None)
+
+        counts = {"success": 0, "not_open": 0, "sold": 0, "throttled": 0, "error": 0}
+        sold = set()
+        # 不再尝试的场地：已售出，或放票后返回了无法识别的失败
+        skipped = set()
+        winner = None
+        sent = in_flight = 0
+        cost = max(1, self.order_hedge)
+        backoff = 1.0
+
+        def handle(rank, order_result):
+            nonlocal winner, backoff
+            if order_result is None:
+                return
+            status = self.classify_order_result(order_result)
+            counts[status] += 1
+            court = courts[rank]
+            if status == "success":
+                if winner is None:
+                    winner = (rank, order_result)
+                    stop_event.set()
+                else:
+                    self.log_message(f"场地 {court['court_name']} 也预约成功")
+                    self.release_duplicate_order(order_result, winner[1])
+            elif status == "sold":
+                skipped.add(rank)
+                if rank not in sold:
+                    sold.add(rank)
+                    self.log_message(f"场地 {court['court_name']} 已被预约，改试下一个场地")
+            elif status == "error" and time.time() >= target and rank not in skipped:
+                skipped.add(rank)
+                self.log_message(f"场地 {court['court_name']} 预约失败：{order_result.get('error') or self._brief(order_result)}，改试下一个场地")
+            elif status == "throttled":
+                backoff = min(backoff * 2, 8.0)
+                self.log_message(f"请求被限流，发送间隔调整为 {interval * backoff * 1000:.0f} ms", level="WARNING")
+
+        # 每个请求占用一个线程直到响应返回，线程数按整个窗口的请求数准备，往返时延较长时后续各轮也能按时发出
+        executor = ThreadPoolExecutor(max_workers=max(1, self.burst_max_requests // cost))
         try:
-            # 创建二维码实例
+            while winner is None:
+                try:
+                    while True:
+                        rank, order_result = responses.get_nowait()
+                        in_flight -= 1
+                        handle(rank, order_result)
+                except queue.Empty:
+                    pass
+                if winner is not None:
+                    break
+
+                ranks = [rank for rank in range(len(courts)) if rank not in skipped][:width]
+                # 对冲下单时每次尝试发送order_hedge个请求
+                budget = (self.burst_max_requests - sent) // cost
+                if not ranks or budget <= 0 or wave_at > deadline:
+                    # 不再发送新请求，只等待在途请求返回
+                    if not in_flight:
+                        break
+                    rank, order_result = responses.get()
+                    in_flight -= 1
+                    handle(rank, order_result)
+                    continue
+
+                # 等待下一轮发送时刻，期间有响应返回就先处理；最后一小段自旋保证间隔准确
+                remaining = wave_at - time.time()
+                if remaining > self.spin_window:
+                    try:
+                        rank, order_result = responses.get(timeout=remaining - self.spin_window)
+                        in_flight -= 1
+                        handle(rank, order_result)
+                        continue
+                    except queue.Empty:
+                        pass
+                deadline_mono = time.perf_counter() + (wave_at - time.time())
+                while time.perf_counter() < deadline_mono:
+                    pass
+
+                for rank in ranks[:budget]:
+                    executor.submit(attempt, rank)
+                    sent += cost
+                    in_flight += 1
+                wave_at += interval * backoff
+        finally:
+            # 不等待在途请求，未开始的直接取消；已经返回但还没处理的响应在这里处理
+            stop_event.set()
+            with late_lock:
+                closed = True
+            while True:
+                try:
+                    rank, order_result = responses.get_nowait()
+                except queue.Empty:
+                    break
+                handle(rank, order_result)
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        if retired is not None:
+            retired.update(courts[rank]["court_id"] for rank in skipped)
+        summary = "，".join(f"{status} {count}" for status, count in counts.items() if count)
+        self.log_message(f"放票窗口共发送 {sent} 个订单请求（{summary or '无响应'}）")
+        if self.timeline is not None:
+            self.timeline.add("burst", "window", sent=sent, **counts)
+
+        if winner is not None:
+            return self._booking_success(courts[winner[0]], winner[1])
+        if courts and len(sold) == len(courts):
+            return {"error": "所有可用场地都已被预约"}
+        return {"error": f"放票窗口内未能预约成功（共发送 {sent} 个请求）"}
+
+    def render_qr_png(self, payment_url: str, box_size: int = 10) -> bytes:
+        """
+        在内存中生成支付二维码PNG，同一URL只生成一次
+        """
+        key = (payment_url, box_size)
+        with self._qr_lock:
+            if key in self._qr_cache:
+                return self._qr_cache[key]
+
+        with self._phase("qr"):
+            # qrcode及其依赖的PIL只在生成二维码时才导入，缩短程序启动时间
+            import qrcode
+
             qr = qrcode.QRCode(
                 version=1,
                 error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
+                box_size=box_size,
                 border=4,
             )
-            
-            # 添加数据
             qr.add_data(payment_url)
             qr.make(fit=True)
-            
-            # 创建二维码图片 - 修复这里
             img = qr.make_image(fill_color="black", back_color="white")
-            
-            # 保存图片
-            img.save(filename)
-            self.log_message(f"二维码已生成并保存为: {filename}")
-            
-            # 尝试自动打开二维码图片
-            try:
-                os.startfile(filename)  # Windows系统
-                self.log_message("二维码图片已自动打开")
-            except:
-                self.log_message("请手动打开二维码图片进行扫码支付")
-            
+            buffer = io.BytesIO()
+            img.save(buffer, format="PNG")
+            png = buffer.getvalue()
+
+        with self._qr_lock:
+            self._qr_cache[key] = png
+        if self.qr_save_path:
+            self.save_qr_file(png, self.qr_save_path)
+        return png
+
+    def render_qr_async(self, payment_url: str, box_size: int = 10) -> Future:
+        """
+        在后台线程生成二维码，不阻塞后续的预约尝试；返回结果为PNG字节的Future
+        """
+        with self._qr_lock:
+            if self._qr_executor is None:
+                self._qr_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="qr")
+        return self._qr_executor.submit(self.render_qr_png, payment_url, box_size)
+
+    def close(self):
+        """释放连接池、二维码生成线程和后台查询线程"""
+        self.session.close()
+        for executor in (self._qr_executor, self._hedge_executor, self._scan_executor):
+            if executor is not None:
+                executor.shutdown(wait=False)
+        self._qr_executor = self._hedge_executor = self._scan_executor = None
+
+    def save_qr_file(self, png: bytes, filename: str) -> str:
+        try:
+            with open(filename, "wb") as f:
+                f.write(png)
+            self.log_message(f"二维码已保存为: {filename}")
             return filename
+        except OSError as e:
+            self.log_message(f"保存二维码失败: {e}", level="ERROR")
+            return ""
+
+    def generate_qr_code(self, payment_url: str, filename: str = "payment_qr.png") -> str:
+        """
+        生成支付二维码并保存为文件，尝试用系统默认程序打开
+        """
+        try:
+            png = self.render_qr_png(payment_url)
         except Exception as e:
-            self.log_message(f"生成二维码失败: {e}")
+            self.log_message(f"生成二维码失败: {e}", level="ERROR")
+            return ""
+        if not self.save_qr_file(png, filename):
             return ""
 
-    def wait_until_10am_beijing(self):
-        """等待到北京时间上午10:00"""
+        # 尝试自动打开二维码图片
+        try:
+            if os.name == "nt":
+                os.startfile(filename)
+            elif sys.platform == "darwin":
+                subprocess.Popen(["open", filename])
+            else:
+                subprocess.Popen(["xdg-open", filename])
+            self.log_message("二维码图片已自动打开")
+        except (OSError, AttributeError):
+            self.log_message("请手动打开二维码图片进行扫码支付")
+        return filename
+
+    def sync_server_clock(self, samples: int = 10) -> Dict[str, Any]:
+        """
+        校准服务器时钟：多次探测base_url主机，根据Date头和往返时延估算时钟偏差
+        """
+        # Date头只精确到秒，每个样本给出偏差的一个区间（假设往返对称，以请求中点为服务器打戳时刻）。
+        # 第一个样本确定宽度1秒的区间后，后续探测都安排在预计的服务器秒边界，每次把区间大致减半
+        lower, upper = float("-inf"), float("inf")
+        rtts = []
+        for i in range(samples):
+            if rtts:
+                estimate = (lower + upper) / 2
+                send_at = math.floor(time.time() + estimate) + 1 - estimate - min(rtts) / 2
+                if send_at - time.time() < 0.02:
+                    send_at += 1
+                self._sleep_until(send_at)
+            try:
+                t0 = time.time()
+                response = self.session.head(self.base_url, timeout=3)
+                t1 = time.time()
+                server_time = parsedate_to_datetime(response.headers["Date"]).timestamp()
+            except Exception as e:
+                self.log_message(f"时钟探测失败: {e}", level="WARNING")
+                continue
+
+            rtt = t1 - t0
+            rtts.append(rtt)
+            # 往返明显偏慢的样本不对称的可能性大，只用于统计时延
+            if rtt > 2 * min(rtts) + 0.005:
+                continue
+            midpoint = (t0 + t1) / 2
+            new_lower = max(lower, server_time - midpoint)
+            new_upper = min(upper, server_time + 1 - midpoint)
+            # 抖动导致与已有区间矛盾时丢弃该样本
+            if new_lower <= new_upper:
+                lower, upper = new_lower, new_upper
+
+        if not rtts:
+            return {"error": "无法获取服务器时间"}
+
+        self.clock_offset = (lower + upper) / 2
+        self.clock_uncertainty = (upper - lower) / 2
+        self.rtt = statistics.median(rtts)
+        self.clock_synced_at = time.time()
+
+        result = {
+            "offset_ms": self.clock_offset * 1000,
+            "uncertainty_ms": self.clock_uncertainty * 1000,
+            "rtt_ms": self.rtt * 1000,
+            "samples": len(rtts)
+        }
+        self.log_message(
+            f"服务器时钟偏差: {result['offset_ms']:+.1f} ms (±{result['uncertainty_ms']:.1f} ms)，"
+            f"往返时延: {result['rtt_ms']:.1f} ms，有效样本: {result['samples']}"
+        )
+        return result
+
+    def get_release_target(self) -> float:
+        """
+        计算下一个放票时刻（服务器北京时间）对应的本地时间戳
+        """
+        # 首次计算放票时刻时才导入时区数据
+        import pytz
         beijing_tz = pytz.timezone('Asia/Shanghai')
-        
+        server_now = datetime.fromtimestamp(time.time() + self.clock_offset, beijing_tz)
+        target_time = server_now.replace(hour=self.release_hour, minute=self.release_minute,
+                                         second=self.release_second, microsecond=0)
+
+        # 如果已经过了今天的放票时刻，则设置为明天
+        if server_now >= target_time:
+            target_time += timedelta(days=1)
+
+        return target_time.timestamp() - self.clock_offset
+
+    def _send_base(self, target: float) -> float:
+        """请求恰好在target到达服务器的本地发送时刻：在途约半个往返时延，再加上可配置的提前量"""
+        return target - self.rtt / 2 - self.release_lead_ms / 1000
+
+    def _send_start(self, target: float) -> float:
+        """第一个下单请求的发送时刻：启用突发窗口时从窗口起点开始发送"""
+        send_at = self._send_base(target)
+        if self.burst_window_ms is not None:
+            send_at += self.burst_window_ms[0] / 1000
+        return send_at
+
+    def wait_until_release(self, target: Optional[float] = None) -> Dict[str, Any]:
+        """
+        等待到放票时刻：先粗粒度休眠，最后几毫秒自旋，使请求恰好在目标时刻到达服务器
+        """
+        if target is None:
+            target = self.get_release_target()
+
+        send_at = self._send_start(target)
+        last_announced = None
+
         while True:
-            now_beijing = datetime.now(beijing_tz)
-            # 计算今天上午10:00的时间
-            target_time = now_beijing.replace(hour=10, minute=0, second=0, microsecond=0)
-            
-            
-            # 如果已经过了今天的10:00，则设置为明天的10:00
-            if now_beijing >= target_time:
-                target_time += timedelta(days=1)
-            
-            time_diff = target_time - now_beijing
-            total_seconds = int(time_diff.total_seconds())
-            
-            if total_seconds <= 0:
-                self.log_message("⏰ 北京时间10:00已到，开始执行预约！")
+            remaining = send_at - time.time()
+            if remaining <= self.spin_window:
                 break
-            
+            self._emit(CountdownTick(send_at, remaining, "wait"))
+
             # 只在最后5秒显示倒计时
-            if total_seconds <= 5:
-                self.log_message(f"⏰ 倒计时: {total_seconds} 秒")
-            
-            # 每秒检查一次
-            time.sleep(1)
-        
-        print()  # 换行
+            seconds_left = int(remaining) + 1
+            if seconds_left <= 5 and seconds_left != last_announced:
+                self.log_message(f"⏰ 倒计时: {seconds_left} 秒")
+                last_announced = seconds_left
+
+            time.sleep(min(remaining - self.spin_window, 1.0))
+
+        # 换算到单调时钟上自旋，避免系统时间被调整造成跳变
+        deadline = time.perf_counter() + (send_at - time.time())
+        while time.perf_counter() < deadline:
+            pass
+
+        error_ms = (time.time() - send_at) * 1000
+        self.log_message(f"⏰ 放票时刻已到，开始执行预约！发送时刻误差: {error_ms:+.2f} ms")
+        return {"target": target, "send_at": send_at, "error_ms": error_ms}
+
+    def new_adapter(self, pool_size: int) -> PinnedHTTPAdapter:
+        """创建使用预解析地址、记录请求计时的适配器"""
+        return PinnedHTTPAdapter(pool_connections=4, pool_maxsize=pool_size, on_trace=self._record_http,
+                                 governor=self.governor)
+
+    def _mount_adapter(self, pool_size: int):
+        """为会话挂载固定大小的长连接池"""
+        adapter = self.new_adapter(pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _record_http(self, trace: Dict[str, Any]):
+        if self.timeline is not None:
+            self.timeline.record_http(trace)
+
+    def _phase(self, name: str):
+        """在当前时间线上记录一个阶段，没有时间线时不做任何事"""
+        if self.timeline is None:
+            return nullcontext()
+        return self.timeline.phase(name)
+
+    def save_timeline(self, path: Optional[str] = None) -> str:
+        """
+        将当前时间线保存为JSON Lines文件
+        """
+        if self.timeline is None:
+            return ""
+        if path is None:
+            filename = datetime.fromtimestamp(self.timeline.origin_wall).strftime("timeline-%Y%m%d-%H%M%S.jsonl")
+            path = os.path.join(self.timeline_dir or ".", filename)
+        self.timeline.save(path)
+        self.log_message(f"运行时间线已保存: {path}")
+        return path
+
+    def _connection_pool(self):
+        """获取session访问base_url时实际使用的urllib3连接池"""
+        adapter = self.session.get_adapter(self.base_url)
+        request = requests.Request("HEAD", self.base_url).prepare()
+        # 与session发请求时合并的环境设置保持一致，否则会拿到另一个连接池
+        settings = self._send_settings()
+        return adapter.get_connection_with_tls_context(
+            request, verify=settings["verify"], proxies=settings["proxies"], cert=settings["cert"]
+        )
+
+    def resolve_host(self) -> Optional[str]:
+        """
+        预先解析base_url的主机地址并缓存，之后建连不再经过DNS
+        """
+        parts = urlsplit(self.base_url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        try:
+            address = socket.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)[0][4][0]
+        except OSError as e:
+            self.log_message(f"解析主机地址失败: {e}", level="WARNING")
+            return None
+        _resolved_hosts[parts.hostname] = address
+        return address
+
+    def _ping_connection(self, conn) -> bool:
+        """在指定连接上发送轻量HEAD请求，返回连接是否仍可复用"""
+        path = urlsplit(self.base_url).path or "/"
+        try:
+            conn.request("HEAD", path, headers={"Connection": "keep-alive"})
+            response = conn.getresponse()
+            response.read()
+            if response.headers.get("Connection", "").lower() == "close":
+                conn.close()
+                return False
+            return True
+        except Exception:
+            conn.close()
+            return False
+
+    def refresh_connections(self, count: Optional[int] = None, ping: bool = False) -> int:
+        """
+        检查连接池中的长连接，重建已断开的连接并补足到count个，返回可用连接数
+        """
+        if count is None:
+            count = max(self.warm_pool_size, self.order_fanout * self.order_hedge)
+
+        pool = self._connection_pool()
+        if count > pool.pool.maxsize:
+            # 连接池不够大时重新挂载，之前的连接随旧池一起丢弃
+            self._mount_adapter(count)
+            pool = self._connection_pool()
+
+        checked_out = []
+        while True:
+            try:
+                checked_out.append(pool.pool.get(block=False))
+            except queue.Empty:
+                break
+
+        live = []
+        for conn in checked_out:
+            if conn is None:
+                continue
+            if not conn.is_connected:
+                conn.close()
+                continue
+            if ping and not self._ping_connection(conn):
+                continue
+            live.append(conn)
+
+        while len(live) < min(count, len(checked_out)):
+            conn = pool._new_conn()
+            try:
+                conn.connect()
+            except Exception as e:
+                self.log_message(f"建立连接失败: {e}", level="WARNING")
+                break
+            live.append(conn)
+
+        # 归还连接，空位用None占位保持容量不变；连接池后进先出，长连接最后放入
+        for _ in range(len(checked_out) - len(live)):
+            pool.pool.put(None, block=False)
+        for conn in live:
+            pool.pool.put(conn, block=False)
+        return len(live)
+
+    def warm_connections(self, count: Optional[int] = None) -> int:
+        """
+        预热连接：解析并缓存主机地址，建立指定数量的长连接（完成TCP和TLS握手）
+        """
+        address = self.resolve_host()
+        live = self.refresh_connections(count)
+        self.log_message(f"连接预热完成: {live} 个长连接，服务器地址 {address}")
+        return live
+
+    def _sleep_until(self, timestamp: float, send_at: Optional[float] = None):
+        """粗粒度休眠到指定本地时间戳，给出send_at时每秒发出一次倒计时事件"""
+        while True:
+            now = time.time()
+            remaining = timestamp - now
+            if remaining <= 0:
+                return
+            if send_at is not None:
+                self._emit(CountdownTick(send_at, send_at - now, "prepare"))
+            time.sleep(min(remaining, 1.0))
+
+    def order_mode(self) -> str:
+        """当前的下单方式，记入运行历史"""
+        if self.burst_window_ms is not None:
+            mode = "burst"
+        else:
+            mode = "fanout" if self.order_fanout > 1 else "sequential"
+        return mode + ("+hedge" if self.order_hedge > 1 else "")
+
+    def burst_end_ms(self, fanout: int) -> float:
+        """突发窗口实际的结束时刻（相对发送基准的毫秒数）：窗口终点，或请求总数用完的时刻，取较早者"""
+        start_ms, end_ms = self.burst_window_ms
+        width = max(1, fanout)
+        interval_ms = max(self.burst_interval_ms, 1000.0 * width / self.burst_max_rate)
+        waves = max(1, self.burst_max_requests // (width * max(1, self.order_hedge)))
+        return min(end_ms, start_ms + (waves - 1) * interval_ms)
+
+    def apply_tuning(self) -> Optional[Dict[str, Any]]:
+        """
+        按运行历史自动调整提前量和并发数，返回采用的建议（没有历史或未开启时返回None）
+        """
+        if self.history is None or not self.auto_tune:
+            return None
+        burst_start = self.burst_window_ms[0] if self.burst_window_ms is not None else 0.0
+        # 并发数可能加1，按加1后的请求数估计突发窗口实际持续到哪里
+        burst_end = self.burst_end_ms(self.order_fanout + 1) if self.burst_window_ms is not None else None
+        try:
+            recommendation = self.history.recommend(self.release_lead_ms, self.order_fanout, burst_start,
+                                                    max_fanout=self.max_order_workers, burst_end_ms=burst_end)
+        except Exception as e:
+            self.log_message(f"读取运行历史失败: {e}", level="WARNING")
+            return None
+        if recommendation is None:
+            return None
+        self.release_lead_ms = recommendation["release_lead_ms"]
+        self.order_fanout = recommendation["order_fanout"]
+        self.log_message(f"根据最近 {recommendation['runs']} 次运行调整: 提前量 {self.release_lead_ms:+.1f} ms，"
+                         f"并发 {self.order_fanout}（{recommendation['reason']}）")
+        return recommendation
+
+    def _attempt_rows(self, plan: BookingPlan) -> List[Dict[str, Any]]:
+        """本次运行中属于该计划的下单请求，发送时刻换算为相对放票时刻的毫秒数"""
+        court_ids = {court["court_id"] for court in plan.courts}
+        rows = []
+        for sent_at, received_at, body, server_date, result in list(self.order_attempts or ()):
+            try:
+                court_id = str(json.loads(body).get("soOpenid"))
+            except (TypeError, ValueError):
+                continue
+            if court_id not in court_ids:
+                continue
+            try:
+                server_time = parsedate_to_datetime(server_date).timestamp() if server_date else None
+            except (TypeError, ValueError):
+                server_time = None
+            rows.append({
+                "sent_ms": round((sent_at - plan.release_at) * 1000, 3),
+                "latency_ms": round((received_at - sent_at) * 1000, 3),
+                "result": self.classify_order_result(result),
+                "court_id": court_id,
+                "server_date": server_time,
+            })
+        return rows
+
+    def record_run(self, plan: BookingPlan, result: Dict[str, Any], trigger_error_ms: Optional[float] = None):
+        """把一次放票下单记入运行历史"""
+        if self.history is None:
+            return
+        attempts = self._attempt_rows(plan)
+        results = {attempt["result"] for attempt in attempts}
+        if result.get("success"):
+            outcome = "success"
+        elif "sold" in results:
+            outcome = "lost"
+        elif results == {"not_open"}:
+            outcome = "not_open"
+        else:
+            outcome = "error"
+        run = {
+            "phone": self.session_phone,
+            "date": plan.date,
+            "time_slot": plan.time_slot,
+            "mode": self.order_mode(),
+            "release_lead_ms": self.release_lead_ms,
+            "burst_start_ms": self.burst_window_ms[0] if self.burst_window_ms is not None else 0.0,
+            "order_fanout": self.order_fanout,
+            "order_hedge": self.order_hedge,
+            "rtt_ms": self.rtt * 1000,
+            "clock_offset_ms": self.clock_offset * 1000,
+            "trigger_error_ms": trigger_error_ms,
+            "outcome": outcome,
+            "court_name": result.get("court_name"),
+        }
+        try:
+            self.history.record(run, attempts)
+        except Exception as e:
+            self.log_message(f"保存运行历史失败: {e}", level="WARNING")
+
+    def log_request_budget(self):
+        """输出本次运行的请求计数和放票窗口预算的使用情况，同时记入时间线"""
+        stats = self.governor.stats()
+        self.log_message(f"请求预算: {self.governor.summary()}", payload=stats)
+        if self.timeline is not None:
+            self.timeline.add("governor", "budget", window_used=stats["window_used"],
+                              window_capacity=stats["window_capacity"], backoffs=stats["backoffs"],
+                              endpoints=stats["endpoints"])
+
+    def open_request_window(self, target: float):
+        """为本次放票设置限速器的放票窗口，窗口内的请求使用单独的预算"""
+        end_ms = self.burst_window_ms[1] if self.burst_window_ms is not None else 0.0
+        if self.cancel_order_path:
+            self.governor.add_endpoint(self.cancel_order_path, CANCEL_ORDER_LIMIT, window=True)
+        self.governor.open_window(target - self.verify_lead, target + end_ms / 1000 + self.governor_window_tail)
+
+    def resync_clock_if_stale(self, target: float) -> float:
+        """
+        时钟校准结果超过clock_sync_ttl秒时重新校准，返回按新偏差换算的本地放票时刻；
+        离最终连接检查太近（校准约需10秒）时不再校准
+        """
+        stale = self.clock_synced_at is None or time.time() - self.clock_synced_at > self.clock_sync_ttl
+        if not stale or time.time() > target - self.verify_lead - 12.0:
+            return target
+        offset = self.clock_offset
+        self.log_message("时钟校准结果已过期，重新校准服务器时钟...")
+        self.sync_server_clock()
+        return target + offset - self.clock_offset
+
+    def prepare_connections(self, target: float, resync: bool = True) -> float:
+        """
+        放票前预热连接并定期保活，临近放票时确认连接仍然可用；
+        resync为True时在预热开始时重新校准过期的时钟，返回（可能更新后的）本地放票时刻
+        """
+        self.open_request_window(target)
+        send_at = self._send_start(target) if self.events is not None else None
+        self._sleep_until(target - self.warm_lead, send_at)
+        if resync:
+            resynced = self.resync_clock_if_stale(target)
+            if resynced != target:
+                target = resynced
+                self.open_request_window(target)
+                send_at = self._send_start(target) if send_at is not None else None
+        self.warm_connections()
+
+        verify_at = target - self.verify_lead
+        while True:
+            next_ping = time.time() + self.keepalive_interval
+            if next_ping >= verify_at:
+                break
+            self._sleep_until(next_ping, send_at)
+            self.refresh_connections(ping=True)
+
+        self._sleep_until(verify_at, send_at)
+        live = self.refresh_connections()
+        self.log_message(f"放票前连接检查: {live} 个长连接可用")
+        return target
 
 # 使用示例
 def main():
@@ -307,17 +1741,22 @@ def main():
     time_slot = "16:30--18:30"  # 时间段
 
     booking.log_message(f"=== 开始湘湖小学羽毛球场地预约流程 (预约日期: {date}) ===")
-    
-    # 步骤1: 发送验证码
-    booking.log_message("步骤1: 发送验证码")
-    sms_result = booking.send_sms_code(phone)
-    if "error" in sms_result:
-        booking.log_message(f"发送验证码失败: {sms_result['error']}")
-        return
-    
-    # 等待用户输入验证码
-    print("\n")
-    sms_code = input("请输入收到的验证码: ")
+    booking.session_store = SessionStore()
+    booking.history = RunHistory()
+
+    sms_code = ""
+    if not booking.restore_session(phone):
+        # 步骤1: 发送验证码
+        booking.log_message("步骤1: 发送验证码")
+        sms_result = booking.send_sms_code(phone)
+        if "error" in sms_result:
+            booking.log_message(f"发送验证码失败: {sms_result['error']}")
+            return
+
+        # 等待用户输入验证码
+        print("\n")
+        sms_code = input("请输入收到的验证码: ")
+        booking.login_with_sms(phone, sms_code)
     
     # 执行剩余的预约流程
     result = booking.complete_booking_process(
@@ -339,17 +1778,6 @@ def main():
         qr_filename = booking.generate_qr_code(result["payment_url"])
         if qr_filename:
             booking.log_message(f"支付二维码已生成，请扫描 {qr_filename} 进行支付")
-            
-            # 可选：尝试打开二维码图片
-            try:
-                if os.name == 'nt':  # Windows
-                    os.startfile(qr_filename)
-                elif os.name == 'posix':  # macOS/Linux
-                    os.system(f'open {qr_filename}')  # macOS
-                    # os.system(f'xdg-open {qr_filename}')  # Linux
-                booking.log_message("二维码图片已自动打开")
-            except:
-                booking.log_message("请手动打开二维码图片文件")
     else:
         booking.log_message("\n预约失败,请重新预约")
 
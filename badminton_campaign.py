@@ -0,0 +1,305 @@
+"""
+多账号、多时间段预约活动
+
+在一个进程内同时为多个账号预约多个(日期, 时间段)：共用一次时钟校准和同一个放票触发，
+每个账号使用独立的会话和连接池，同一时间段的候选场地在我方账号之间错开分配，避免自己人抢同一块场地。
+
+配置文件（JSON）格式：
+{
+    "release": {"hour": 10, "minute": 0, "second": 0, "lead_ms": 0},
+    "order_fanout": 2,
+    "session_dir": "可选，会话缓存目录（默认用户目录下的.badminton_booking）",
+    "base_url": "可选，接口地址（默认真实服务器）",
+    "history": "可选，运行历史数据库路径（默认用户目录下的.badminton_booking，false表示不记录）",
+    "venues": [{"space_id": "111162", "sport_type": "2", "name": "可选，场馆目录，靠前的场馆优先；也可以是目录文件路径"}],
+    "recapture": {"duration_s": 1800, "payment_window_s": 600},
+    "accounts": [
+        {
+            "phone": "18273475755",
+            "token": "可选，已登录的token",
+            "user_id": "可选，与token配套的userId",
+            "targets": [
+                {"date": "2025-01-02", "time_slot": "18:30--20:30"},
+                {"days_ahead": 1, "time_slot": "16:30--18:30"}
+            ]
+        }
+    ]
+}
+recapture可选（true或如上的设置）：放票失败的目标继续监视，抢回订单超时未支付而重新释放的场地。
+未提供token且没有有效缓存会话的账号会发送短信验证码并在终端输入（非交互模式下跳过该账号）。
+"""
+import argparse
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+from badminton_booking import BadmintonBooking, BookingPlan
+from badminton_history import RunHistory
+from badminton_session_store import SessionStore
+from badminton_venues import load_venues, parse_venues
+
+
+class BookingCampaign:
+    def __init__(self, config: Dict[str, Any], interactive: bool = True):
+        self.config = config
+        # 非交互模式（无人值守）下不发送短信验证码，没有可用会话的账号直接跳过
+        self.interactive = interactive
+        self.release = config.get("release", {})
+        self.order_fanout = config.get("order_fanout", 1)
+        self.accounts = config["accounts"]
+        venues = config.get("venues")
+        self.venues = load_venues(venues) if isinstance(venues, str) else parse_venues(venues)
+        # 捡漏模式：True/False或{"duration_s": ..., "payment_window_s": ...}
+        recapture = config.get("recapture", False)
+        self.recapture = recapture if isinstance(recapture, dict) else ({} if recapture else None)
+        # 所有账号共用一个会话缓存
+        self.session_store = SessionStore(config.get("session_dir"))
+        # 所有账号的放票结果记入同一个运行历史，并据此自动调整提前量和并发数
+        history = config.get("history", True)
+        self.history = RunHistory(history if isinstance(history, str) else None) if history else None
+        # 每个账号一个独立的预约实例（独立会话和连接池）
+        self.bookings: Dict[str, BadmintonBooking] = {}
+        # 手机号 -> 该账号的预约计划列表
+        self.plans: Dict[str, List[BookingPlan]] = {}
+        self.results: List[Dict[str, Any]] = []
+
+    @classmethod
+    def from_file(cls, path: str, interactive: bool = True) -> "BookingCampaign":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f), interactive)
+
+    def log_message(self, message):
+        """添加日志消息"""
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        print(f"[{timestamp}] [活动] {message}")
+
+    def _new_booking(self, phone: str) -> BadmintonBooking:
+        booking = BadmintonBooking()
+        booking.base_url = self.config.get("base_url", booking.base_url)
+        booking.log_prefix = f"[{phone}] "
+        booking.release_hour = self.release.get("hour", booking.release_hour)
+        booking.release_minute = self.release.get("minute", booking.release_minute)
+        booking.release_second = self.release.get("second", booking.release_second)
+        booking.release_lead_ms = self.release.get("lead_ms", booking.release_lead_ms)
+        booking.order_fanout = self.order_fanout
+        booking.venues = list(self.venues)
+        booking.session_store = self.session_store
+        booking.history = self.history
+        if self.recapture is not None:
+            booking.recapture = True
+            booking.recapture_duration = self.recapture.get("duration_s", booking.recapture_duration)
+            booking.recapture_payment_window = self.recapture.get("payment_window_s",
+                                                                  booking.recapture_payment_window)
+        return booking
+
+    @staticmethod
+    def _target_date(target: Dict[str, Any]) -> str:
+        if "date" in target:
+            return target["date"]
+        return (datetime.now() + timedelta(days=target.get("days_ahead", 1))).strftime("%Y-%m-%d")
+
+    def login_all(self) -> bool:
+        """
+        为每个账号准备已登录的会话，没有token的账号先尝试恢复缓存的会话，再走短信验证码登录；
+        非交互模式下跳过没有可用会话的账号，至少有一个账号可用时返回True
+        """
+        for account in self.accounts:
+            phone = account["phone"]
+            booking = self._new_booking(phone)
+            if account.get("token"):
+                booking.token = account["token"]
+                booking.user_id = account.get("user_id")
+                booking.session_phone = phone
+                booking.session.headers.update({"Token": booking.token})
+            elif booking.restore_session(phone):
+                # 临近过期的会话顺延有效期
+                booking.refresh_session_if_needed()
+            elif not self.interactive:
+                self.log_message(f"{phone} 没有可用的会话，需要重新短信登录，跳过该账号")
+                for target in account.get("targets", []):
+                    self.results.append({"phone": phone, "date": self._target_date(target),
+                                         "time_slot": target["time_slot"],
+                                         "error": "没有可用的会话，需要重新短信登录"})
+                booking.session.close()
+                continue
+            else:
+                sms_result = booking.send_sms_code(phone)
+                if "error" in sms_result:
+                    self.log_message(f"{phone} 发送验证码失败: {sms_result['error']}")
+                    return False
+                sms_code = input(f"请输入 {phone} 收到的验证码: ")
+                login_result = booking.login_with_sms(phone, sms_code)
+                if "error" in login_result or not booking.token:
+                    self.log_message(f"{phone} 登录失败")
+                    return False
+            self.bookings[phone] = booking
+        return bool(self.bookings)
+
+    def arm_all(self) -> int:
+        """
+        并发为所有账号的所有目标生成预约计划，返回成功生成的计划数
+        """
+        jobs = [(account["phone"], self._target_date(target), target["time_slot"])
+                for account in self.accounts if account["phone"] in self.bookings
+                for target in account.get("targets", [])]
+
+        for booking in self.bookings.values():
+            booking.apply_tuning()
+            booking.order_attempts = [] if booking.history is not None else None
+
+        # 不同账号并发准备；同一账号的多个目标依次准备，避免在同一个实例上同时校准时钟
+        phones = list(dict.fromkeys(job[0] for job in jobs))
+
+        def arm_account(phone):
+            booking = self.bookings[phone]
+            return [(job, booking.arm(job[1], job[2])) for job in jobs if job[0] == phone]
+
+        with ThreadPoolExecutor(max_workers=max(1, len(phones))) as executor:
+            armed_results = [item for items in executor.map(arm_account, phones) for item in items]
+
+        for (phone, date, time_slot), armed in armed_results:
+            if "error" in armed:
+                self.results.append({"phone": phone, "date": date, "time_slot": time_slot,
+                                     "error": armed["error"]})
+                continue
+            self.plans.setdefault(phone, []).append(armed["plan"])
+
+        self._allocate_courts()
+        return sum(len(plans) for plans in self.plans.values())
+
+    def _allocate_courts(self):
+        """
+        多个我方计划的候选场地有重叠时（不论时间段写法、场馆或备选日期是否相同，按场地ID判断），
+        各计划轮流按自己的偏好顺序挑选尚未分配的场地，互不重叠；候选场地少的计划先挑
+        """
+        members = [(phone, index) for phone, plans in self.plans.items() for index in range(len(plans))]
+        owners: Dict[str, int] = {}
+        for phone, index in members:
+            for court in self.plans[phone][index].courts:
+                owners[court["court_id"]] = owners.get(court["court_id"], 0) + 1
+        if all(count < 2 for count in owners.values()):
+            return
+
+        members.sort(key=lambda member: len(self.plans[member[0]][member[1]].courts))
+        queues = {member: [court["court_id"] for court in self.plans[member[0]][member[1]].courts]
+                  for member in members}
+        shares: Dict[tuple, List[str]] = {member: [] for member in members}
+        claimed = set()
+        while any(queues.values()):
+            for member in members:
+                pending = queues[member]
+                while pending and pending[0] in claimed:
+                    pending.pop(0)
+                if pending:
+                    court_id = pending.pop(0)
+                    claimed.add(court_id)
+                    shares[member].append(court_id)
+
+        for phone, index in members:
+            plan = self.plans[phone][index]
+            if len(shares[(phone, index)]) == len(plan.courts):
+                continue
+            plan = self.plans[phone][index] = plan.restricted_to(shares[(phone, index)])
+            names = "、".join(c["court_name"] for c in plan.courts) or "无（候选场地都已分给其他计划）"
+            self.log_message(f"{phone} {plan.date} {plan.time_slot} 分配场地: {names}")
+
+    def _run_account(self, phone: str, target: float, fire_event: threading.Event) -> List[tuple]:
+        booking = self.bookings[phone]
+        plans = self.plans[phone]
+        booking.warm_pool_size = max(booking.warm_pool_size, booking.order_fanout * len(plans))
+        # 时钟已由触发账号统一重新校准，各账号不再单独校准
+        booking.prepare_connections(target, resync=False)
+        fire_event.wait()
+
+        if len(plans) == 1:
+            results = [(plans[0], booking.fire(plans[0]))]
+        else:
+            with ThreadPoolExecutor(max_workers=len(plans)) as executor:
+                results = list(zip(plans, executor.map(booking.fire, plans)))
+        booking.log_request_budget()
+        for plan, result in results:
+            booking.record_run(plan, result)
+
+        # 放票失败的目标进入捡漏模式，同一账号的多个目标同时监视
+        lost = [index for index, (plan, result) in enumerate(results) if not result.get("success")]
+        if booking.recapture and lost:
+            with ThreadPoolExecutor(max_workers=len(lost)) as executor:
+                recaptured = list(executor.map(booking.recapture_courts, [results[i][0] for i in lost]))
+            for index, result in zip(lost, recaptured):
+                results[index] = (results[index][0], result)
+        return results
+
+    def run(self) -> List[Dict[str, Any]]:
+        """
+        完整活动流程：登录、生成计划、共享放票触发、并发下单、汇总结果
+        """
+        if not self.login_all():
+            return self.results
+        if not self.arm_all():
+            self.log_message("没有可执行的预约计划")
+            return self.results
+
+        # 以第一个账号的时钟校准结果作为共享触发基准；距放票较远时先等到预热开始，校准过期则重新校准
+        trigger = next(self.bookings[phone] for phone in self.plans)
+        target = trigger.get_release_target()
+        trigger._sleep_until(target - trigger.warm_lead)
+        target = trigger.resync_clock_if_stale(target)
+        for booking in self.bookings.values():
+            booking.clock_offset = trigger.clock_offset
+            booking.rtt = trigger.rtt
+        for phone, plans in self.plans.items():
+            self.plans[phone] = [replace(plan, release_at=target) for plan in plans]
+
+        fire_event = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=len(self.plans))
+        futures = {phone: executor.submit(self._run_account, phone, target, fire_event)
+                   for phone in self.plans}
+        trigger.wait_until_release(target)
+        fire_event.set()
+
+        for phone, future in futures.items():
+            for plan, result in future.result():
+                row = {"phone": phone, "date": plan.date, "time_slot": plan.time_slot}
+                row.update(result)
+                self.results.append(row)
+        executor.shutdown()
+
+        self.print_summary()
+        return self.results
+
+    def close(self):
+        """释放各账号的连接"""
+        for booking in self.bookings.values():
+            booking.close()
+
+    def print_summary(self):
+        """输出汇总结果表"""
+        self.log_message("=== 预约结果汇总 ===")
+        print(f"{'手机号':<13}{'日期':<12}{'时间段':<15}{'结果':<6}{'场地/原因'}")
+        for row in self.results:
+            status = "成功" if row.get("success") else "失败"
+            detail = row.get("court_name") if row.get("success") else row.get("error", "")
+            print(f"{row['phone']:<15}{row['date']:<14}{row['time_slot']:<16}{status:<6}{detail}")
+        won = sum(1 for row in self.results if row.get("success"))
+        self.log_message(f"共 {len(self.results)} 个目标，成功 {won} 个")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="多账号羽毛球场地预约")
+    parser.add_argument("config", help="活动配置文件(JSON)")
+    parser.add_argument("--output", help="将结果写入JSON文件")
+    args = parser.parse_args(argv)
+
+    campaign = BookingCampaign.from_file(args.config)
+    results = campaign.run()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+无人值守的每日预约守护进程（不使用Tk）
+
+两次放票之间只有一个休眠的线程，不保留连接和预约实例；每天放票前arm_lead秒唤醒，
+重新读取配置，用缓存的会话（badminton_session_store）执行一次多账号预约活动（badminton_campaign），
+结果逐行追加到JSON Lines文件，并可调用本地通知命令，随后释放全部连接继续休眠。
+
+配置文件与badminton_campaign相同，另外支持：
+{
+    "arm_lead": 180,
+    "results_file": "booking_results.jsonl",
+    "notify_command": ["notify-send", "羽毛球预约"],
+    "qr_dir": "qr"
+}
+arm_lead为放票前多少秒唤醒（登录校验、获取场地、校准时钟、预热连接都在这段时间内完成）；
+notify_command可选，每次运行的结果以JSON通过标准输入传给该命令；
+qr_dir可选，预约成功时把支付二维码保存到该目录。
+
+守护进程不会发送短信验证码，首次运行或会话失效后先执行login子命令登录并缓存会话：
+    python badminton_daemon.py login config.json
+    python badminton_daemon.py run config.json [--once]
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+from badminton_campaign import BookingCampaign
+
+DEFAULT_ARM_LEAD = 180.0
+DEFAULT_RESULTS_FILE = "booking_results.jsonl"
+# 长时间休眠时每次最多睡这么久，系统休眠或时间调整后能及时重新计算
+MAX_SLEEP_CHUNK = 300.0
+
+
+def next_release(release: Dict[str, Any]) -> float:
+    """下一个放票时刻（北京时间）对应的本地时间戳"""
+    import pytz
+    now = datetime.now(pytz.timezone("Asia/Shanghai"))
+    target = now.replace(hour=release.get("hour", 10), minute=release.get("minute", 0),
+                         second=release.get("second", 0), microsecond=0)
+    if now >= target:
+        target += timedelta(days=1)
+    return target.timestamp()
+
+
+def sleep_until(timestamp: float):
+    while True:
+        remaining = timestamp - time.time()
+        if remaining <= 0:
+            return
+        time.sleep(min(remaining, MAX_SLEEP_CHUNK))
+
+
+class BookingDaemon:
+    def __init__(self, config_path: str):
+        self.config_path = config_path
+
+    def load_config(self) -> Dict[str, Any]:
+        with open(self.config_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def log_message(self, message):
+        """添加日志消息"""
+        timestamp = datetime.now().strftime("%m-%d %H:%M:%S")
+        print(f"[{timestamp}] [守护] {message}", flush=True)
+
+    def login(self) -> bool:
+        """交互式登录配置中的全部账号，会话写入缓存供守护进程使用"""
+        campaign = BookingCampaign(self.load_config(), interactive=True)
+        try:
+            return campaign.login_all()
+        finally:
+            campaign.close()
+
+    def run_window(self) -> List[Dict[str, Any]]:
+        """
+        执行一次放票窗口的预约，返回各目标的结果
+        """
+        config = self.load_config()
+        campaign = BookingCampaign(config, interactive=False)
+        try:
+            results = campaign.run()
+            if config.get("qr_dir"):
+                self.save_qr_codes(campaign, results, config["qr_dir"])
+        finally:
+            campaign.close()
+
+        self.record(results, config.get("results_file", DEFAULT_RESULTS_FILE))
+        if config.get("notify_command"):
+            self.notify(results, config["notify_command"])
+        return results
+
+    def save_qr_codes(self, campaign: BookingCampaign, results: List[Dict[str, Any]], qr_dir: str):
+        os.makedirs(qr_dir, exist_ok=True)
+        for row in results:
+            if not row.get("success"):
+                continue
+            booking = campaign.bookings[row["phone"]]
+            filename = os.path.join(qr_dir, f"{row['phone']}_{row['date']}_{row['time_slot'].replace(':', '')}.png")
+            try:
+                row["qr_file"] = booking.save_qr_file(booking.render_qr_png(row["payment_url"]), filename)
+            except Exception as e:
+                self.log_message(f"生成二维码失败: {e}")
+
+    def record(self, results: List[Dict[str, Any]], path: str):
+        """每个目标一行追加到结果文件"""
+        run_at = datetime.now().isoformat(timespec="seconds")
+        with open(path, "a", encoding="utf-8") as f:
+            for row in results:
+                f.write(json.dumps(dict(row, run_at=run_at), ensure_ascii=False) + "\n")
+        won = sum(1 for row in results if row.get("success"))
+        self.log_message(f"结果已写入 {path}: 共 {len(results)} 个目标，成功 {won} 个")
+
+    def notify(self, results: List[Dict[str, Any]], command: List[str]):
+        """把本次结果以JSON通过标准输入传给通知命令"""
+        try:
+            subprocess.run(command, input=json.dumps(results, ensure_ascii=False), text=True,
+                           timeout=30, check=True)
+        except (OSError, subprocess.SubprocessError) as e:
+            self.log_message(f"通知命令执行失败: {e}")
+
+    def run_forever(self, once: bool = False):
+        while True:
+            config = self.load_config()
+            release_at = next_release(config.get("release", {}))
+            wake_at = release_at - config.get("arm_lead", DEFAULT_ARM_LEAD)
+            self.log_message(f"下次放票 {datetime.fromtimestamp(release_at):%Y-%m-%d %H:%M:%S}，"
+                             f"将于 {datetime.fromtimestamp(wake_at):%H:%M:%S} 唤醒")
+            sleep_until(wake_at)
+
+            try:
+                self.run_window()
+            except Exception as e:
+                self.log_message(f"本次预约异常: {e}")
+            # 两次放票之间不保留任何连接和大对象
+            gc.collect()
+            if once:
+                return
+            # 确保越过本次放票时刻后再计算下一次
+            sleep_until(release_at + 1)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="无人值守的每日羽毛球场地预约")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    login = subparsers.add_parser("login", help="短信登录配置中的账号并缓存会话")
+    login.add_argument("config", help="配置文件(JSON)")
+
+    run = subparsers.add_parser("run", help="常驻运行，每天放票前唤醒预约")
+    run.add_argument("config", help="配置文件(JSON)")
+    run.add_argument("--once", action="store_true", help="只执行下一次放票窗口后退出")
+
+    args = parser.parse_args(argv)
+    daemon = BookingDaemon(args.config)
+    if args.command == "login":
+        raise SystemExit(0 if daemon.login() else 1)
+    daemon.run_forever(once=args.once)
+
+
+if __name__ == "__main__":
+    main()
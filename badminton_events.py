@@ -0,0 +1,84 @@
+"""
+预约流程的进度事件
+
+BadmintonBooking在关键节点发出带类型的事件（计划就绪、倒计时、开始下单、各场地结果、支付就绪、流程结束），
+订阅者在发出事件的线程中被调用，只应做入队之类的轻量操作：GUI把事件交给Tk主线程处理，
+下单线程本身从不接触界面。
+"""
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Tuple
+
+
+@dataclass(frozen=True)
+class Armed:
+    """预约计划已就绪"""
+    date: str
+    time_slot: str
+    # 本地放票时刻与实际开始发送的时刻（已扣除往返时延、提前量和突发窗口起点）
+    release_at: float
+    send_at: float
+    courts: Tuple[Dict[str, str], ...]
+    description: str
+
+
+@dataclass(frozen=True)
+class CountdownTick:
+    """等待放票期间的粗粒度心跳，界面据send_at自行以毫秒精度刷新倒计时"""
+    send_at: float
+    remaining: float
+    phase: str
+
+
+@dataclass(frozen=True)
+class Fired:
+    """到达发送时刻，开始下单"""
+    send_at: float
+    error_ms: float
+
+
+@dataclass(frozen=True)
+class CourtResult:
+    """某个场地的一次下单结果，status为classify_order_result的分类"""
+    court_id: str
+    court_name: str
+    slice_time: str
+    status: str
+    message: str
+    latency_ms: float
+
+
+@dataclass(frozen=True)
+class PaymentReady:
+    """预约成功，得到支付链接"""
+    court_id: str
+    court_name: str
+    payment_url: str
+
+
+@dataclass(frozen=True)
+class Finished:
+    """预约流程结束（成功或失败）"""
+    result: Dict[str, Any] = field(default_factory=dict)
+
+
+class EventBus:
+    def __init__(self):
+        self._subscribers: List[Callable[[Any], None]] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback: Callable[[Any], None]):
+        with self._lock:
+            self._subscribers = self._subscribers + [callback]
+
+    def unsubscribe(self, callback: Callable[[Any], None]):
+        with self._lock:
+            self._subscribers = [subscriber for subscriber in self._subscribers if subscriber is not callback]
+
+    def emit(self, event: Any):
+        """在当前线程依次通知订阅者；订阅者的异常不影响预约流程"""
+        for callback in self._subscribers:
+            try:
+                callback(event)
+            except Exception:
+                pass
@@ -0,0 +1,221 @@
+"""
+客户端请求限速
+
+所有经BadmintonBooking会话发出的请求都先向RequestGovernor申请额度：
+平时按接口各自的令牌桶限速；放票窗口内的下单请求改用单独的、更大的窗口预算，
+其他请求（如后台轮询）和窗口外的请求都不会占用它。
+响应为HTTP 429/5xx或提示“频繁/繁忙/限流”等时视为被服务器限流，之后该接口的请求按指数退避（带随机抖动）暂停，
+各接口分别退避，后台轮询被限流不会拖慢放票窗口内的下单；
+各接口的请求数、限流次数和等待时间都有计数，用于查看每次运行用掉了多少额度。
+"""
+import random
+import threading
+import time
+from typing import Dict, Any, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+# 接口路径后缀 -> (每秒请求数, 突发上限)，未列出的接口使用DEFAULT_LIMIT
+DEFAULT_LIMITS = {
+    "/user/loginSms": (0.2, 1),
+    "/user/SOLoginPhone": (0.5, 2),
+    "/open/getSpaceOrderDetailsNew": (20.0, 20),
+    "/order/createOrderBatch": (5.0, 5),
+}
+DEFAULT_LIMIT = (10.0, 20)
+# 放票窗口内使用窗口预算的接口；取消订单等可选接口配置后再用add_endpoint登记
+WINDOW_ENDPOINTS = ("/order/createOrderBatch",)
+# 取消订单接口的限速
+CANCEL_ORDER_LIMIT = (5.0, 5)
+# 限流提示较短，只检查不超过这个长度的响应体，避免为场地数据等大响应做文本搜索
+THROTTLE_BODY_LIMIT = 2048
+
+
+class TokenBucket:
+    """令牌桶，预约式扣减：令牌不足时返回需要等待的秒数（调用方加锁）"""
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, now: float, cost: float = 1.0) -> float:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= cost
+        return max(0.0, -self.tokens / self.rate)
+
+
+class RequestGovernor:
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None,
+                 default_limit: Tuple[float, float] = DEFAULT_LIMIT,
+                 throttle_keywords: Sequence[str] = ()):
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self.default_limit = default_limit
+        self.throttle_keywords = tuple(throttle_keywords)
+        # 放票窗口的预算：适用的接口、每秒请求数和突发上限
+        self.window_endpoints = WINDOW_ENDPOINTS
+        self.window_rate = 40.0
+        self.window_capacity = 30
+        # 被限流后的退避（秒）：平时和放票窗口内分别使用，每次连续限流翻倍，乘以0.5~1的随机系数
+        self.backoff_base = 0.5
+        self.backoff_max = 30.0
+        self.window_backoff_base = 0.05
+        self.window_backoff_max = 1.0
+
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._window: Optional[Tuple[float, float]] = None
+        self._window_bucket: Optional[TokenBucket] = None
+        # 接口 -> [退避截止时刻(monotonic), 连续被限流次数]
+        self._backoff: Dict[str, list] = {}
+        self.reset_counters()
+
+    def reset_counters(self):
+        """清零计数（每次运行开始时调用）"""
+        with self._lock:
+            self.counters: Dict[str, Dict[str, float]] = {}
+            self.window_used = 0
+            self.backoffs = 0
+
+    @staticmethod
+    def endpoint(url: str) -> str:
+        """用于限速和计数的接口名：URL路径的最后两段，如/order/createOrderBatch"""
+        path = urlsplit(url).path.rstrip("/")
+        return "/" + "/".join(path.rsplit("/", 2)[-2:]) if path else "/"
+
+    def _limit(self, endpoint: str) -> Tuple[float, float]:
+        for suffix, limit in self.limits.items():
+            if endpoint.endswith(suffix):
+                return limit
+        return self.default_limit
+
+    def _counter(self, endpoint: str) -> Dict[str, float]:
+        counter = self.counters.get(endpoint)
+        if counter is None:
+            counter = self.counters[endpoint] = {"requests": 0, "window_requests": 0, "throttled": 0,
+                                                 "waits": 0, "waited_ms": 0.0}
+        return counter
+
+    def add_endpoint(self, path: str, limit: Optional[Tuple[float, float]] = None, window: bool = False):
+        """登记默认表中没有的接口：限速，以及放票窗口内是否使用窗口预算（可重复调用）"""
+        endpoint = self.endpoint(path)
+        with self._lock:
+            if limit is not None:
+                self.limits[endpoint] = limit
+            if window and not endpoint.endswith(self.window_endpoints):
+                self.window_endpoints = self.window_endpoints + (endpoint,)
+
+    def open_window(self, start: float, end: float):
+        """设置放票窗口（本地时间戳），窗口预算重新装满"""
+        with self._lock:
+            self._window = (start, end)
+            self._window_bucket = TokenBucket(self.window_rate, self.window_capacity)
+            self.window_used = 0
+
+    def in_window(self, wall: Optional[float] = None) -> bool:
+        window = self._window
+        if window is None:
+            return False
+        wall = time.time() if wall is None else wall
+        return window[0] <= wall <= window[1]
+
+    def acquire(self, url: str) -> float:
+        """
+        发送请求前申请额度，需要时阻塞等待，返回等待的秒数
+        """
+        endpoint = self.endpoint(url)
+        now = time.monotonic()
+        with self._lock:
+            counter = self._counter(endpoint)
+            counter["requests"] += 1
+            backoff = self._backoff.get(endpoint)
+            backoff_wait = backoff[0] - now if backoff else 0.0
+            if (self._window_bucket is not None and endpoint.endswith(self.window_endpoints)
+                    and self.in_window()):
+                counter["window_requests"] += 1
+                self.window_used += 1
+                bucket = self._window_bucket
+                # 窗口开始前遗留的较长退避不让窗口内的请求等太久
+                backoff_wait = min(backoff_wait, self.window_backoff_max)
+            else:
+                bucket = self._buckets.get(endpoint)
+                if bucket is None:
+                    bucket = self._buckets[endpoint] = TokenBucket(*self._limit(endpoint))
+            delay = max(bucket.reserve(now), backoff_wait)
+            if delay > 0:
+                counter["waits"] += 1
+                counter["waited_ms"] += delay * 1000
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def is_throttled(self, response, check_body: bool = True) -> bool:
+        """HTTP 429/5xx，或较短的响应体中含有限流提示"""
+        status = response.status_code
+        if status == 429 or 500 <= status < 600:
+            return True
+        if not check_body or not self.throttle_keywords or status != 200:
+            return False
+        content = response.content
+        if not content or len(content) > THROTTLE_BODY_LIMIT:
+            return False
+        text = content.decode("utf-8", "ignore")
+        return any(keyword in text for keyword in self.throttle_keywords)
+
+    def _retry_after(self, response) -> Optional[float]:
+        value = response.headers.get("Retry-After")
+        try:
+            return float(value) if value else None
+        except ValueError:
+            return None
+
+    def observe(self, url: str, response, check_body: bool = True) -> bool:
+        """
+        根据响应更新限流状态，被限流时设置退避，返回是否被限流；流式响应不检查响应体
+        """
+        throttled = self.is_throttled(response, check_body)
+        endpoint = self.endpoint(url)
+        now = time.monotonic()
+        with self._lock:
+            backoff = self._backoff.get(endpoint)
+            if not throttled:
+                if backoff is not None:
+                    backoff[1] = 0
+                return False
+            if backoff is None:
+                backoff = self._backoff[endpoint] = [0.0, 0]
+            self._counter(endpoint)["throttled"] += 1
+            self.backoffs += 1
+            if endpoint.endswith(self.window_endpoints) and self.in_window():
+                base, cap = self.window_backoff_base, self.window_backoff_max
+            else:
+                base, cap = self.backoff_base, self.backoff_max
+            delay = min(cap, base * (2 ** backoff[1])) * random.uniform(0.5, 1.0)
+            retry_after = self._retry_after(response)
+            if retry_after is not None:
+                delay = max(delay, min(cap, retry_after))
+            backoff[1] += 1
+            backoff[0] = max(backoff[0], now + delay)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """各接口的计数，以及放票窗口预算的使用情况"""
+        with self._lock:
+            return {
+                "endpoints": {endpoint: dict(counter) for endpoint, counter in self.counters.items()},
+                "window_used": self.window_used,
+                "window_capacity": self.window_capacity,
+                "backoffs": self.backoffs,
+            }
+
+    def summary(self) -> str:
+        """一行可读摘要"""
+        stats = self.stats()
+        endpoints = stats["endpoints"].values()
+        requests = sum(counter["requests"] for counter in endpoints)
+        throttled = sum(counter["throttled"] for counter in endpoints)
+        waited_ms = sum(counter["waited_ms"] for counter in endpoints)
+        return (f"请求 {requests} 个，放票窗口预算 {stats['window_used']}/{stats['window_capacity']}，"
+                f"被限流 {throttled} 次，限速等待 {waited_ms:.1f} ms")
@@ -1,10 +1,79 @@
 import tkinter as tk
-from tkinter import ttk, scrolledtext, messagebox
+from tkinter import ttk, scrolledtext, messagebox, filedialog
 import threading
 from datetime import datetime, timedelta
-from badminton_booking import BadmintonBooking
+from badminton_booking import BadmintonBooking, LogRecord
+from badminton_session_store import SessionStore
+from badminton_history import RunHistory
+from badminton_venues import load_venues, venue_names
+from badminton_events import EventBus, Armed, CountdownTick, Fired, CourtResult, PaymentReady, Finished
 import sys
 import io
+import os
+import json
+import base64
+import time
+import queue
+
+# 日志控件最多保留的行数，以及每次刷新的间隔（毫秒）和最多处理的记录数
+LOG_MAX_LINES = 2000
+LOG_FLUSH_MS = 100
+LOG_BATCH = 500
+# GUI中显示的二维码每个模块的像素数
+QR_BOX_SIZE = 5
+# 检查缓存会话是否需要续期的间隔（毫秒）
+SESSION_REFRESH_MS = 30 * 60 * 1000
+# 设置该环境变量（文件路径）时记录启动耗时并在会话就绪后退出，供badminton_bench.py startup使用
+STARTUP_PROBE_ENV = "BADMINTON_STARTUP_PROBE"
+# 主线程处理事件队列的间隔，以及倒计时的刷新间隔（毫秒）
+EVENT_PUMP_MS = 20
+COUNTDOWN_REFRESH_MS = 50
+# 场地状态表中各分类的显示文字
+COURT_STATUS_TEXT = {"success": "成功", "not_open": "未开放", "sold": "已被预约", "throttled": "被限流",
+                     "error": "失败"}
+COUNTDOWN_PHASE_TEXT = {"prepare": "准备中", "wait": "等待放票"}
+
+
+class MainThreadDispatcher:
+    """
+    把工作线程发出的事件和界面操作转交Tk主线程执行：任意线程只负责入队，
+    主线程用after()定期取出，按事件类型调用处理函数
+    """
+    def __init__(self, root):
+        self.root = root
+        self._queue = queue.Queue()
+        self._handlers = {}
+        self.root.after(EVENT_PUMP_MS, self._pump)
+
+    def on(self, event_type, handler):
+        """注册某类事件的处理函数（主线程调用）"""
+        self._handlers.setdefault(event_type, []).append(handler)
+
+    def post(self, event):
+        """投递事件（可在任意线程调用），可直接作为EventBus的订阅者"""
+        self._queue.put((None, event))
+
+    def call(self, func, *args):
+        """在主线程中执行func(*args)（可在任意线程调用）"""
+        self._queue.put((func, args))
+
+    def _pump(self):
+        # 先安排下一次处理，处理函数打开模态对话框时事件仍能继续刷新界面
+        self.root.after(EVENT_PUMP_MS, self._pump)
+        while True:
+            try:
+                func, payload = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                if func is None:
+                    for handler in self._handlers.get(type(payload), ()):
+                        handler(payload)
+                else:
+                    func(*payload)
+            except Exception:
+                self.root.report_callback_exception(*sys.exc_info())
+
 
 class BadmintonGUI:
     def __init__(self, root):
@@ -12,14 +81,38 @@ class BadmintonGUI:
         self.root.title("羽毛球预约系统")
         self.root.geometry("600x700")
         
+        # 启动过程中的关键时刻（time.time()）
+        self.startup_marks = {}
+        
+        # 日志队列：任意线程只负责入队，由Tk主线程批量写入控件
+        self.log_queue = queue.Queue()
+        
         # 创建预约实例
         self.booking = BadmintonBooking()
+        self.booking.log_sink = self.log_queue.put
+        self.booking.session_store = SessionStore()
+        self.booking.history = RunHistory()
         
         # 创建界面
         self.create_widgets()
         
+        # 预约引擎的进度事件经调度器在主线程中更新倒计时和场地状态表
+        self.dispatcher = MainThreadDispatcher(self.root)
+        self.booking.events = EventBus()
+        self.booking.events.subscribe(self.dispatcher.post)
+        self.dispatcher.on(Armed, self.on_armed)
+        self.dispatcher.on(CountdownTick, self.on_countdown_tick)
+        self.dispatcher.on(Fired, self.on_fired)
+        self.dispatcher.on(CourtResult, self.on_court_result)
+        self.dispatcher.on(PaymentReady, self.on_payment_ready)
+        self.dispatcher.on(Finished, self.on_finished)
+        
         # 重定向输出到GUI
         self.redirect_output()
+        self.root.after(LOG_FLUSH_MS, self.flush_log_queue)
+        
+        # 尝试恢复上次登录的会话
+        self.restore_cached_session()
         
     def create_widgets(self):
         # 主框架
@@ -59,6 +152,21 @@ class BadmintonGUI:
         self.time_slot_var = tk.StringVar(value="18:30--20:30")
         self.time_slot_entry = ttk.Entry(booking_frame, textvariable=self.time_slot_var, width=20)
         self.time_slot_entry.grid(row=0, column=1, sticky=(tk.W, tk.E), padx=(10, 0), pady=5)
+        ttk.Label(booking_frame, text="多个备选时间段用逗号分隔，靠前优先", foreground="gray").grid(
+            row=1, column=1, sticky=tk.W, padx=(10, 0))
+        
+        # 捡漏模式：放票失败后继续监视，抢回订单超时未支付而重新释放的场地
+        self.recapture_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(booking_frame, text="放票失败后继续捡漏（订单超时释放的场地）",
+                        variable=self.recapture_var).grid(row=2, column=1, sticky=tk.W, padx=(10, 0), pady=(5, 0))
+        
+        # 场馆目录（按偏好排序），默认只有湘湖小学羽毛球
+        ttk.Label(booking_frame, text="场馆:").grid(row=3, column=0, sticky=tk.W, pady=5)
+        self.venues_var = tk.StringVar(value=self.describe_venues())
+        ttk.Label(booking_frame, textvariable=self.venues_var, wraplength=300).grid(
+            row=3, column=1, sticky=tk.W, padx=(10, 0), pady=5)
+        ttk.Button(booking_frame, text="加载场馆目录", command=self.load_venue_catalog).grid(
+            row=3, column=2, padx=(10, 0), pady=5)
         
         # 开始预约按钮
         self.start_booking_btn = ttk.Button(booking_frame, text="开始预约", command=self.start_booking, state="disabled")
@@ -69,58 +177,267 @@ class BadmintonGUI:
         status_frame.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 10))
         
         self.status_var = tk.StringVar(value="未登录")
-        self.status_label = ttk.Label(status_frame, textvariable=self.status_var, foreground="red")
+        self.status_label = ttk.Label(status_frame, textvariable=self.status_var, foreground="red", wraplength=540)
         self.status_label.grid(row=0, column=0, sticky=tk.W)
         
+        # 距离开始下单的倒计时（毫秒精度）
+        self.countdown_var = tk.StringVar()
+        ttk.Label(status_frame, textvariable=self.countdown_var, font=("TkFixedFont", 14)).grid(
+            row=1, column=0, sticky=tk.W, pady=(5, 0))
+        self.send_at = None
+        self.countdown_phase = ""
+        self.countdown_job = None
+        
+        # 各候选场地的下单状态
+        courts_frame = ttk.LabelFrame(main_frame, text="场地状态", padding="10")
+        courts_frame.grid(row=3, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 10))
+        self.court_tree = ttk.Treeview(courts_frame, columns=("court", "status", "attempts", "info"),
+                                       show="headings", height=4)
+        for column, text, width in (("court", "场地", 220), ("status", "状态", 80),
+                                    ("attempts", "次数", 50), ("info", "耗时/信息", 180)):
+            self.court_tree.heading(column, text=text)
+            self.court_tree.column(column, width=width, anchor=tk.W)
+        self.court_tree.grid(row=0, column=0, sticky=(tk.W, tk.E))
+        self.court_tree.tag_configure("success", foreground="green")
+        self.court_tree.tag_configure("sold", foreground="gray")
+        self.court_tree.tag_configure("throttled", foreground="orange")
+        self.court_tree.tag_configure("error", foreground="red")
+        self.court_attempts = {}
+        
+        # 支付二维码区域（预约成功后显示）
+        self.qr_frame = ttk.LabelFrame(main_frame, text="支付二维码", padding="10")
+        self.qr_frame.grid(row=4, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 10))
+        self.qr_label = ttk.Label(self.qr_frame)
+        self.qr_label.grid(row=0, column=0, rowspan=2)
+        self.qr_info_var = tk.StringVar()
+        ttk.Label(self.qr_frame, textvariable=self.qr_info_var, wraplength=300).grid(
+            row=0, column=1, sticky=tk.W, padx=(10, 0))
+        save_qr_btn = ttk.Button(self.qr_frame, text="保存二维码", command=self.save_qr_code)
+        save_qr_btn.grid(row=1, column=1, sticky=tk.W, padx=(10, 0))
+        self.qr_frame.grid_remove()
+        self.qr_image = None
+        self.qr_url = None
+        
         # 日志区域
         log_frame = ttk.LabelFrame(main_frame, text="控制台日志", padding="10")
-        log_frame.grid(row=3, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
+        log_frame.grid(row=5, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
         
         # 日志文本框
-        self.log_text = scrolledtext.ScrolledText(log_frame, width=70, height=20, wrap=tk.WORD)
+        self.log_text = scrolledtext.ScrolledText(log_frame, width=70, height=14, wrap=tk.WORD)
         self.log_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         
         # 清空日志按钮
-        clear_btn = ttk.Button(log_frame, text="清空日志", command=self.clear_log)
-        clear_btn.grid(row=1, column=0, pady=(10, 0))
+        log_buttons = ttk.Frame(log_frame)
+        log_buttons.grid(row=1, column=0, pady=(10, 0))
+        clear_btn = ttk.Button(log_buttons, text="清空日志", command=self.clear_log)
+        clear_btn.grid(row=0, column=0)
+        
+        # 保存运行时间线按钮
+        save_timeline_btn = ttk.Button(log_buttons, text="保存时间线", command=self.save_timeline)
+        save_timeline_btn.grid(row=0, column=1, padx=(10, 0))
+        
+        # 显示完整响应数据（调试）
+        self.debug_var = tk.BooleanVar(value=False)
+        debug_check = ttk.Checkbutton(log_buttons, text="显示详细数据", variable=self.debug_var,
+                                      command=self.toggle_debug)
+        debug_check.grid(row=0, column=2, padx=(10, 0))
+        
+        self.log_text.tag_config("WARNING", foreground="orange")
+        self.log_text.tag_config("ERROR", foreground="red")
         
         # 配置网格权重
         main_frame.columnconfigure(1, weight=1)
-        main_frame.rowconfigure(3, weight=1)
+        main_frame.rowconfigure(5, weight=1)
         login_frame.columnconfigure(1, weight=1)
         booking_frame.columnconfigure(1, weight=1)
+        courts_frame.columnconfigure(0, weight=1)
         log_frame.columnconfigure(0, weight=1)
         log_frame.rowconfigure(0, weight=1)
         self.root.columnconfigure(0, weight=1)
         self.root.rowconfigure(0, weight=1)
         
     def redirect_output(self):
-        """重定向print输出到GUI日志"""
-        class TextRedirector:
-            def __init__(self, widget):
-                self.widget = widget
+        """重定向print输出到日志队列"""
+        class QueueRedirector:
+            def __init__(self, log_queue):
+                self.log_queue = log_queue
                 
             def write(self, string):
-                self.widget.insert(tk.END, string)
-                self.widget.see(tk.END)
-                self.widget.update()
+                if string:
+                    self.log_queue.put(string)
                 
             def flush(self):
                 pass
                 
-        sys.stdout = TextRedirector(self.log_text)
+        sys.stdout = QueueRedirector(self.log_queue)
         
     def log_message(self, message):
-        """添加日志消息"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        log_entry = f"[{timestamp}] {message}\n"
-        self.log_text.insert(tk.END, log_entry)
-        self.log_text.see(tk.END)
+        """添加日志消息（可在任意线程调用）"""
+        self.log_queue.put(LogRecord(time.time(), "INFO", message))
+        
+    def toggle_debug(self):
+        """切换是否输出完整响应数据"""
+        self.booking.log_level = "DEBUG" if self.debug_var.get() else "INFO"
+        
+    def flush_log_queue(self):
+        """在Tk主线程中批量写入日志，并限制控件中保留的行数"""
+        with_payload = self.debug_var.get()
+        chunks = []
+        for _ in range(LOG_BATCH):
+            try:
+                item = self.log_queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, LogRecord):
+                text, level = item.format(with_payload) + "\n", item.level
+            else:
+                text, level = item, "INFO"
+            # 相邻同级别的日志合并为一次插入
+            if chunks and chunks[-1][1] == level:
+                chunks[-1][0].append(text)
+            else:
+                chunks.append(([text], level))
+        
+        if chunks:
+            for texts, level in chunks:
+                self.log_text.insert(tk.END, "".join(texts), level)
+            excess = int(self.log_text.index("end-1c").split(".")[0]) - LOG_MAX_LINES
+            if excess > 0:
+                self.log_text.delete("1.0", f"{excess + 1}.0")
+            self.log_text.see(tk.END)
+        
+        # 队列还有积压时尽快继续处理
+        delay = 1 if not self.log_queue.empty() else LOG_FLUSH_MS
+        self.root.after(delay, self.flush_log_queue)
         
     def clear_log(self):
         """清空日志"""
         self.log_text.delete(1.0, tk.END)
         
+    def save_timeline(self):
+        """保存最近一次预约的运行时间线"""
+        if self.booking.timeline is None:
+            messagebox.showinfo("提示", "还没有可保存的运行时间线")
+            return
+        path = filedialog.asksaveasfilename(defaultextension=".jsonl",
+                                            filetypes=[("JSON Lines", "*.jsonl")])
+        if path:
+            self.booking.save_timeline(path)
+        
+    def show_payment_qr(self, payment_url, court_name=""):
+        """后台生成支付二维码，完成后显示在二维码区域"""
+        future = self.booking.render_qr_async(payment_url, QR_BOX_SIZE)
+
+        def on_rendered():
+            try:
+                png = future.result()
+            except Exception as e:
+                self.log_message(f"生成二维码失败: {e}")
+                return
+            # Tk 8.6的PhotoImage可直接读取base64编码的PNG
+            self.qr_image = tk.PhotoImage(data=base64.b64encode(png))
+            self.qr_url = payment_url
+            self.qr_label.config(image=self.qr_image)
+            self.qr_info_var.set(f"请使用微信扫码支付 {court_name}".strip())
+            self.qr_frame.grid()
+            # 固定的窗口大小容不下二维码时按内容重新计算
+            self.root.geometry("")
+
+        future.add_done_callback(lambda _: self.dispatcher.call(on_rendered))
+
+    def describe_venues(self):
+        return "、".join(venue_names(self.booking.venues).values())
+
+    def load_venue_catalog(self):
+        """从JSON文件加载场馆目录，之后的预约同时查询其中所有场馆"""
+        path = filedialog.askopenfilename(filetypes=[("JSON", "*.json")])
+        if not path:
+            return
+        try:
+            self.booking.venues = load_venues(path)
+        except Exception as e:
+            messagebox.showerror("错误", f"加载场馆目录失败: {e}")
+            return
+        self.venues_var.set(self.describe_venues())
+        self.log_message(f"已加载场馆目录: {self.describe_venues()}")
+
+    def save_qr_code(self):
+        """把当前显示的二维码保存为PNG文件"""
+        if self.qr_url is None:
+            return
+        path = filedialog.asksaveasfilename(defaultextension=".png", initialfile="payment_qr.png",
+                                            filetypes=[("PNG图片", "*.png")])
+        if path:
+            self.booking.save_qr_file(self.booking.render_qr_png(self.qr_url, QR_BOX_SIZE), path)
+
+    def set_status(self, text, color):
+        """更新状态信息（主线程调用）"""
+        self.status_var.set(text)
+        self.status_label.config(foreground=color)
+
+    def on_armed(self, event):
+        """预约计划就绪：列出候选场地并开始倒计时"""
+        self.set_status(f"已就绪: {event.description}", "blue")
+        self.court_tree.delete(*self.court_tree.get_children())
+        self.court_attempts = {}
+        for court in event.courts:
+            if not self.court_tree.exists(court["court_id"]):
+                self.court_tree.insert("", tk.END, iid=court["court_id"],
+                                       values=(self.booking.court_label(court), "等待", 0, ""))
+        self.start_countdown(event.send_at)
+
+    def on_countdown_tick(self, event):
+        """引擎的粗粒度心跳：校正发送时刻，界面自行按毫秒刷新"""
+        self.countdown_phase = COUNTDOWN_PHASE_TEXT.get(event.phase, event.phase)
+        self.start_countdown(event.send_at)
+
+    def start_countdown(self, send_at):
+        self.send_at = send_at
+        if self.countdown_job is None:
+            self.update_countdown()
+
+    def stop_countdown(self, text=""):
+        if self.countdown_job is not None:
+            self.root.after_cancel(self.countdown_job)
+            self.countdown_job = None
+        self.send_at = None
+        self.countdown_var.set(text)
+
+    def update_countdown(self):
+        remaining = max(0.0, self.send_at - time.time())
+        minutes, seconds = divmod(remaining, 60)
+        hours, minutes = divmod(int(minutes), 60)
+        phase = f"{self.countdown_phase} " if self.countdown_phase else ""
+        self.countdown_var.set(f"{phase}距开始下单 {hours:02d}:{minutes:02d}:{seconds:06.3f}")
+        self.countdown_job = self.root.after(COUNTDOWN_REFRESH_MS, self.update_countdown)
+
+    def on_fired(self, event):
+        self.stop_countdown(f"已开始下单（触发误差 {event.error_ms:+.1f} ms）")
+        self.set_status("正在下单...", "blue")
+
+    def on_court_result(self, event):
+        """更新某个场地的下单状态，不在候选列表中的场地追加一行"""
+        attempts = self.court_attempts[event.court_id] = self.court_attempts.get(event.court_id, 0) + 1
+        values = (f"{event.slice_time} {event.court_name}".strip(), COURT_STATUS_TEXT.get(event.status, event.status),
+                  attempts, f"{event.latency_ms:.0f} ms {event.message}".strip())
+        if self.court_tree.exists(event.court_id):
+            values = (self.court_tree.set(event.court_id, "court"),) + values[1:]
+            self.court_tree.item(event.court_id, values=values, tags=(event.status,))
+        else:
+            self.court_tree.insert("", tk.END, iid=event.court_id, values=values, tags=(event.status,))
+
+    def on_payment_ready(self, event):
+        """预约成功：标记场地并显示支付二维码"""
+        if self.court_tree.exists(event.court_id):
+            self.court_tree.set(event.court_id, "status", "待支付")
+            self.court_tree.item(event.court_id, tags=("success",))
+        self.set_status(f"预约成功，请支付: {event.court_name}", "green")
+        self.show_payment_qr(event.payment_url, event.court_name)
+
+    def on_finished(self, event):
+        if self.send_at is not None:
+            self.stop_countdown()
+
     def send_verification_code(self):
         """发送验证码"""
         phone = self.phone_var.get().strip()
@@ -128,27 +445,84 @@ class BadmintonGUI:
             messagebox.showerror("错误", "请输入手机号")
             return
             
+        # 工作线程不直接操作界面，按钮和对话框都交给主线程
+        self.send_code_btn.config(state="disabled", text="发送中...")
+        
         def send_code_thread():
-            self.send_code_btn.config(state="disabled", text="发送中...")
             try:
                 self.log_message(f"步骤1：在向 {phone} 发送验证码...")
                 result = self.booking.send_sms_code(phone)
                 
                 if "error" in result:
                     self.log_message(f"发送验证码失败: {result['error']}")
-                    messagebox.showerror("错误", f"发送验证码失败: {result['error']}")
+                    self.dispatcher.call(messagebox.showerror, "错误", f"发送验证码失败: {result['error']}")
                 else:
                     self.log_message("验证码发送成功，请查收短信")
-                    messagebox.showinfo("成功", "验证码发送成功，请查收短信")
+                    self.dispatcher.call(messagebox.showinfo, "成功", "验证码发送成功，请查收短信")
                     
             except Exception as e:
                 self.log_message(f"发送验证码异常: {str(e)}")
-                messagebox.showerror("错误", f"发送验证码异常: {str(e)}")
+                self.dispatcher.call(messagebox.showerror, "错误", f"发送验证码异常: {str(e)}")
             finally:
-                self.send_code_btn.config(state="normal", text="发送验证码")
+                self.dispatcher.call(self.send_code_btn.config, {"state": "normal", "text": "发送验证码"})
                 
         threading.Thread(target=send_code_thread, daemon=True).start()
         
+    def restore_cached_session(self):
+        """后台恢复最近一次登录的会话，成功后无需短信登录即可预约"""
+        phone = self.booking.session_store.last_phone() or self.phone_var.get().strip()
+        if not phone:
+            self.startup_marks["session_ready"] = time.time()
+            return
+
+        def on_restored(restored):
+            self.startup_marks["session_ready"] = time.time()
+            if not restored:
+                return
+            self.phone_var.set(phone)
+            self.set_status("已登录（已恢复缓存的会话）", "green")
+            self.start_booking_btn.config(state="normal")
+            self.root.after(SESSION_REFRESH_MS, self.refresh_session)
+
+        def restore_thread():
+            restored = self.booking.restore_session(phone)
+            self.dispatcher.call(on_restored, restored)
+
+        threading.Thread(target=restore_thread, daemon=True).start()
+
+    def startup_probe(self, path):
+        """记录窗口首次显示和会话就绪的时刻，写入path后退出"""
+        def on_map(event):
+            if event.widget is self.root and "first_frame" not in self.startup_marks:
+                self.root.update_idletasks()
+                self.startup_marks["first_frame"] = time.time()
+
+        def check():
+            if "first_frame" in self.startup_marks and "session_ready" in self.startup_marks:
+                self.startup_marks["session_restored"] = self.start_booking_btn.instate(["!disabled"])
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(self.startup_marks, f)
+                self.root.destroy()
+            else:
+                self.root.after(10, check)
+
+        self.root.bind("<Map>", on_map, add="+")
+        self.root.after(10, check)
+
+    def refresh_session(self):
+        """定期检查会话，临近过期时续期"""
+        def on_expired():
+            self.set_status("会话已失效，请重新登录", "red")
+            self.start_booking_btn.config(state="disabled")
+
+        def refresh_thread():
+            if self.booking.refresh_session_if_needed():
+                self.dispatcher.call(self.root.after, SESSION_REFRESH_MS, self.refresh_session)
+            else:
+                self.dispatcher.call(on_expired)
+
+        threading.Thread(target=refresh_thread, daemon=True).start()
+
     def login(self):
         """登录"""
         phone = self.phone_var.get().strip()
@@ -158,31 +532,35 @@ class BadmintonGUI:
             messagebox.showerror("错误", "请输入手机号和验证码")
             return
             
+        def on_logged_in():
+            self.set_status("已登录", "green")
+            self.start_booking_btn.config(state="normal")
+            self.root.after(SESSION_REFRESH_MS, self.refresh_session)
+            messagebox.showinfo("成功", "登录成功！")
+
+        def on_failed(message):
+            self.set_status("登录失败", "red")
+            messagebox.showerror("错误", message)
+
+        self.login_btn.config(state="disabled", text="登录中...")
+        
         def login_thread():
-            self.login_btn.config(state="disabled", text="登录中...")
             try:
                 self.log_message(f"步骤2： 正在使用手机号 {phone} 登录...")
                 result = self.booking.login_with_sms(phone, code)
                 
                 if "error" in result:
                     self.log_message(f"登录失败: {result['error']}")
-                    messagebox.showerror("错误", f"登录失败: {result['error']}")
-                    self.status_var.set("登录失败")
-                    self.status_label.config(foreground="red")
+                    self.dispatcher.call(on_failed, f"登录失败: {result['error']}")
                 else:
                     self.log_message("登录成功！")
-                    messagebox.showinfo("成功", "登录成功！")
-                    self.status_var.set("已登录")
-                    self.status_label.config(foreground="green")
-                    self.start_booking_btn.config(state="normal")
+                    self.dispatcher.call(on_logged_in)
                     
             except Exception as e:
                 self.log_message(f"登录异常: {str(e)}")
-                messagebox.showerror("错误", f"登录异常: {str(e)}")
-                self.status_var.set("登录失败")
-                self.status_label.config(foreground="red")
+                self.dispatcher.call(on_failed, f"登录异常: {str(e)}")
             finally:
-                self.login_btn.config(state="normal", text="登录")
+                self.dispatcher.call(self.login_btn.config, {"state": "normal", "text": "登录"})
                 
         threading.Thread(target=login_thread, daemon=True).start()
         
@@ -199,38 +577,48 @@ class BadmintonGUI:
         # 计算明天的日期
         tomorrow = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
         
+        def on_done(result):
+            # 下单线程已经结束，这时才弹出对话框；支付二维码已在收到PaymentReady时显示
+            self.start_booking_btn.config(state="normal", text="开始预约")
+            self.on_finished(Finished(result))
+            if "error" in result:
+                self.set_status(f"预约失败: {result['error']}", "red")
+                messagebox.showerror("错误", f"预约失败: {result['error']}")
+            else:
+                messagebox.showinfo("成功", "预约完成，请扫描窗口中的二维码支付")
+
+        self.booking.recapture = self.recapture_var.get()
+        self.start_booking_btn.config(state="disabled", text="预约中...")
+        
         def booking_thread():
-            self.start_booking_btn.config(state="disabled", text="预约中...")
             try:
                 self.log_message(f"开始预约 {tomorrow} {time_slot} 的场地...")
                 result = self.booking.complete_booking_process(phone, code, tomorrow, time_slot)
                 
                 if "error" in result:
                     self.log_message(f"预约失败: {result['error']}")
-                    messagebox.showerror("错误", f"预约失败: {result['error']}")
                 else:
                     self.log_message("预约流程完成！")
                     if "payment_url" in result:
                         self.log_message(f"支付链接: {result['payment_url']}")
-                        # 生成二维码
-                        try:
-                            qr_path = self.booking.generate_qr_code(result['payment_url'])
-                            self.log_message(f"支付二维码已生成: {qr_path}")
-                        except Exception as e:
-                            self.log_message(f"生成二维码失败: {str(e)}")
-                    messagebox.showinfo("成功", "预约完成，请查看日志获取支付信息")
+                
+                # 输出本次运行的时间线摘要
+                if self.booking.timeline is not None:
+                    for line in self.booking.timeline.summary_lines():
+                        self.log_message(line)
                     
             except Exception as e:
                 self.log_message(f"预约异常: {str(e)}")
-                messagebox.showerror("错误", f"预约异常: {str(e)}")
-            finally:
-                self.start_booking_btn.config(state="normal", text="开始预约")
+                result = {"error": str(e)}
+            self.dispatcher.call(on_done, result)
                 
         threading.Thread(target=booking_thread, daemon=True).start()
 
 def main():
     root = tk.Tk()
     app = BadmintonGUI(root)
+    if os.environ.get(STARTUP_PROBE_ENV):
+        app.startup_probe(os.environ[STARTUP_PROBE_ENV])
     root.mainloop()
 
 if __name__ == "__main__":
@@ -0,0 +1,248 @@
+"""
+放票运行历史
+
+每次放票下单后把这次运行记入本地SQLite数据库：提前量、并发数、往返时延、触发误差、结果，
+以及每个下单请求相对放票时刻的发送偏移、耗时、响应分类和服务器Date。
+根据历史估计服务器实际开始受理订单的时刻，自动给出下一次的提前量（release_lead_ms）和并发数（order_fanout）。
+
+用法：python badminton_history.py report --last 20
+"""
+import argparse
+import math
+import os
+import statistics
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from badminton_session_store import default_data_dir
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at REAL NOT NULL,
+    phone TEXT,
+    date TEXT,
+    time_slot TEXT,
+    mode TEXT,
+    release_lead_ms REAL,
+    burst_start_ms REAL,
+    order_fanout INTEGER,
+    order_hedge INTEGER,
+    rtt_ms REAL,
+    clock_offset_ms REAL,
+    trigger_error_ms REAL,
+    outcome TEXT,
+    court_name TEXT
+);
+CREATE TABLE IF NOT EXISTS attempts (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    sent_ms REAL,
+    latency_ms REAL,
+    result TEXT,
+    court_id TEXT,
+    server_date REAL
+);
+CREATE INDEX IF NOT EXISTS attempts_run ON attempts(run_id);
+"""
+
+# 推荐提前量时的限制：每次最多调整的毫秒数、允许的范围，以及从未遇到“未到开放时间”时每次提前试探的毫秒数
+MAX_LEAD_STEP_MS = 50.0
+LEAD_RANGE_MS = (-200.0, 500.0)
+PROBE_STEP_MS = 10.0
+# 突发窗口模式下，放票时刻之后至少还要留给突发窗口的毫秒数（提前量不超过窗口实际结束时刻减去它）
+BURST_COVER_MARGIN_MS = 50.0
+
+
+def default_history_path() -> str:
+    return os.path.join(default_data_dir(), "history.sqlite3")
+
+
+class RunHistory:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or default_history_path()
+        # 多个账号的下单线程可能同时写入，每次操作使用独立连接并串行执行
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        # sqlite3只在首次读写历史时才导入，缩短程序启动时间
+        import sqlite3
+        if not self._initialized:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=5)
+        connection.row_factory = sqlite3.Row
+        if not self._initialized:
+            connection.executescript(SCHEMA)
+            self._initialized = True
+        return connection
+
+    def record(self, run: Dict[str, Any], attempts: List[Dict[str, Any]]) -> int:
+        """
+        记录一次运行及其全部下单请求，返回运行ID
+        """
+        columns = ("phone", "date", "time_slot", "mode", "release_lead_ms", "burst_start_ms", "order_fanout",
+                   "order_hedge", "rtt_ms", "clock_offset_ms", "trigger_error_ms", "outcome", "court_name")
+        with self._lock:
+            connection = self._connect()
+            try:
+                with connection:
+                    cursor = connection.execute(
+                        f"INSERT INTO runs (started_at, {', '.join(columns)}) "
+                        f"VALUES (?, {', '.join('?' for _ in columns)})",
+                        (run.get("started_at", time.time()), *(run.get(column) for column in columns)))
+                    run_id = cursor.lastrowid
+                    connection.executemany(
+                        "INSERT INTO attempts (run_id, sent_ms, latency_ms, result, court_id, server_date) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        [(run_id, attempt.get("sent_ms"), attempt.get("latency_ms"), attempt.get("result"),
+                          attempt.get("court_id"), attempt.get("server_date")) for attempt in attempts])
+            finally:
+                connection.close()
+        return run_id
+
+    def recent_runs(self, last: int = 20) -> List[Dict[str, Any]]:
+        """最近的运行（由新到旧），每条带上按发送时刻排序的attempts"""
+        with self._lock:
+            connection = self._connect()
+            try:
+                runs = [dict(row) for row in connection.execute(
+                    "SELECT * FROM runs ORDER BY started_at DESC, id DESC LIMIT ?", (last,))]
+                for run in runs:
+                    run["attempts"] = [dict(row) for row in connection.execute(
+                        "SELECT sent_ms, latency_ms, result, court_id, server_date FROM attempts "
+                        "WHERE run_id = ? ORDER BY sent_ms", (run["id"],))]
+            finally:
+                connection.close()
+        return runs
+
+    @staticmethod
+    def open_bounds(run: Dict[str, Any]) -> Dict[str, Optional[float]]:
+        """
+        一次运行中服务器开始受理订单的时刻范围（相对放票时刻的毫秒数，按请求到达服务器的估计时刻）：
+        closed为最后一个“未到开放时间”的到达时刻，opened为第一个已受理（成功或已被预约）的到达时刻
+        """
+        closed = opened = None
+        for attempt in run["attempts"]:
+            if attempt["sent_ms"] is None:
+                continue
+            arrive = attempt["sent_ms"] + (attempt["latency_ms"] or 0.0) / 2
+            if attempt["result"] == "not_open":
+                closed = arrive if closed is None else max(closed, arrive)
+            elif attempt["result"] in ("success", "sold"):
+                opened = arrive if opened is None else min(opened, arrive)
+        return {"closed": closed, "opened": opened}
+
+    @staticmethod
+    def first_accepted(run: Dict[str, Any]) -> bool:
+        """一次运行中最早发出的请求（不计被限流的）是否就已被受理，说明服务器开放得比我方首个请求更早"""
+        for attempt in run["attempts"]:
+            if attempt["sent_ms"] is None or attempt["result"] == "throttled":
+                continue
+            return attempt["result"] in ("success", "sold")
+        return False
+
+    def recommend(self, release_lead_ms: float, order_fanout: int, burst_start_ms: float = 0.0,
+                  max_fanout: int = 4, last: int = 10, margin_ms: float = 3.0,
+                  burst_end_ms: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        根据最近的运行推荐下一次的提前量和并发数，没有可用的历史时返回None。
+        提前量：让第一个请求在历次“未到开放时间”的最晚到达时刻（取75分位）之后margin_ms到达，
+        且不晚于已受理请求到达时刻的中位数；从未遇到“未到开放时间”时，只有各次最早的请求都已被受理
+        （确有证据表明开放得更早）才提前PROBE_STEP_MS试探，否则保持不变。
+        burst_end_ms为突发窗口实际结束时刻（相对发送基准）时，提前量不超过它减去BURST_COVER_MARGIN_MS，
+        保证窗口仍覆盖放票时刻。
+        并发数：最近5次中有2次以上被别人抢先（收到“已被预约”且没有成功）时加1；最近3次被限流时减1
+        """
+        runs = [run for run in self.recent_runs(last) if run["attempts"]]
+        if not runs:
+            return None
+
+        bounds = [self.open_bounds(run) for run in runs]
+        closed = [bound["closed"] for bound in bounds if bound["closed"] is not None]
+        opened = [bound["opened"] for bound in bounds if bound["opened"] is not None]
+        reasons = []
+        first_arrival = -release_lead_ms + burst_start_ms
+        if closed:
+            arrival = _percentile(closed, 75) + margin_ms
+            if opened:
+                arrival = min(arrival, statistics.median(opened))
+            reasons.append(f"服务器约在放票后 {arrival - margin_ms:+.1f} ms 开始受理")
+        elif opened and all(self.first_accepted(run) for run in runs if run["attempts"]):
+            arrival = min(first_arrival, statistics.median(opened)) - PROBE_STEP_MS
+            reasons.append(f"未遇到“未到开放时间”，提前 {PROBE_STEP_MS:.0f} ms 试探")
+        else:
+            arrival = first_arrival
+        lead = burst_start_ms - arrival
+        lead = max(release_lead_ms - MAX_LEAD_STEP_MS, min(release_lead_ms + MAX_LEAD_STEP_MS, lead))
+        max_lead = LEAD_RANGE_MS[1]
+        if burst_end_ms is not None:
+            max_lead = min(max_lead, burst_end_ms - BURST_COVER_MARGIN_MS)
+        lead = round(max(LEAD_RANGE_MS[0], min(max_lead, lead)), 1)
+
+        fanout = order_fanout
+        throttled = any(attempt["result"] == "throttled" for run in runs[:3] for attempt in run["attempts"])
+        beaten = sum(1 for run in runs[:5] if run["outcome"] != "success"
+                     and any(attempt["result"] == "sold" for attempt in run["attempts"]))
+        if throttled and fanout > 1:
+            fanout -= 1
+            reasons.append("最近被限流，减少并发")
+        elif beaten >= 2 and fanout < max_fanout:
+            fanout += 1
+            reasons.append(f"最近 {beaten} 次被抢先，增加并发")
+
+        return {"release_lead_ms": lead, "order_fanout": fanout, "runs": len(runs),
+                "reason": "；".join(reasons) or "保持当前设置"}
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(len(ordered) * pct / 100) - 1))
+    return ordered[index]
+
+
+def _fmt(value: Optional[float], width: int = 8) -> str:
+    return f"{value:+{width}.1f}" if value is not None else " " * (width - 1) + "-"
+
+
+def report_command(args):
+    history = RunHistory(args.db)
+    runs = history.recent_runs(args.last)
+    if not runs:
+        print(f"没有运行记录: {history.path}")
+        return
+    print(f"{'时间':<17}{'日期':<12}{'模式':<10}{'提前量':>8}{'并发':>5}{'首发':>9}{'未开放≤':>9}"
+          f"{'已受理≥':>9}{'请求':>5}  结果")
+    for run in reversed(runs):
+        bounds = RunHistory.open_bounds(run)
+        first = run["attempts"][0]["sent_ms"] if run["attempts"] else None
+        started = datetime.fromtimestamp(run["started_at"]).strftime("%m-%d %H:%M:%S")
+        outcome = run["outcome"] + (f" {run['court_name']}" if run["court_name"] else "")
+        print(f"{started:<17}{run['date'] or '':<12}{run['mode'] or '':<10}{_fmt(run['release_lead_ms'])}"
+              f"{run['order_fanout'] or 0:>5}{_fmt(first, 9)}{_fmt(bounds['closed'], 9)}"
+              f"{_fmt(bounds['opened'], 9)}{len(run['attempts']):>5}  {outcome}")
+    won = sum(1 for run in runs if run["outcome"] == "success")
+    print(f"最近 {len(runs)} 次成功 {won} 次")
+
+    latest = runs[0]
+    recommendation = history.recommend(latest["release_lead_ms"] or 0.0, latest["order_fanout"] or 1,
+                                       latest["burst_start_ms"] or 0.0)
+    if recommendation:
+        print(f"下次建议: 提前量 {recommendation['release_lead_ms']:+.1f} ms，"
+              f"并发 {recommendation['order_fanout']}（{recommendation['reason']}）")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="放票运行历史")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report = subparsers.add_parser("report", help="最近各次运行的发送时刻、服务器开放时刻和结果")
+    report.add_argument("--db", default=None, help="历史数据库路径（默认用户目录下的.badminton_booking）")
+    report.add_argument("--last", type=int, default=20)
+    report.set_defaults(func=report_command)
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
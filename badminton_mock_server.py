@@ -0,0 +1,332 @@
+"""
+opensc接口的本地替身服务器
+
+模拟预约流程用到的接口（/user/loginSms、/user/SOLoginPhone、/open/getSpaceOrderDetailsNew、
+/user/verifiedInfo、/order/createOrderBatch，以及取消订单/order/cancelOrder），
+返回与真实接口相同的actionState/data/openSlice结构。
+可模拟多个场馆和多个日期（按spaceId和time返回各自的场地），支持配置响应延迟、偶发的长停顿（模拟丢包重传或慢的服务器线程）、时钟偏差、放票时刻，
+服务器端限流（每个接口每秒超过throttle_rps个请求时返回“请求过于频繁”），
+以及在放票后抢占场地的模拟竞争者，
+用于离线测试和基准测试，不需要在每天10:00访问真实服务器。
+
+用法：python badminton_mock_server.py --port 9071 --release-in 30 --competitors 3
+"""
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qs
+
+API_PREFIX = "/xinshan/opensc"
+
+NOT_OPEN_MESSAGE = "未到开放时间，请稍后再试"
+SOLD_MESSAGE = "该场地已被预约"
+TOKEN_INVALID_MESSAGE = "登录已失效，请重新登录"
+THROTTLED_MESSAGE = "请求过于频繁，请稍后再试"
+# 替身服务器的取消订单接口（客户端默认不调用，需设置BadmintonBooking.cancel_order_path）
+CANCEL_ORDER_PATH = "/order/cancelOrder"
+
+
+class MockOpenscServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, courts: int = 8,
+                 time_slots: Tuple[str, ...] = ("16:30--18:30", "18:30--20:30"),
+                 latency_ms: float = 0.0, jitter_ms: float = 0.0, clock_skew_ms: float = 0.0,
+                 release_at: Optional[float] = None, competitors: int = 0,
+                 competitor_delay_ms: Tuple[float, float] = (20.0, 200.0),
+                 contested_slot: str = "18:30--20:30", stall_probability: float = 0.0,
+                 stall_ms: float = 200.0, spaces: Tuple[str, ...] = ("111162",), dates: Tuple[str, ...] = (),
+                 throttle_rps: float = 0.0):
+        self.host = host
+        self.port = port
+        self.courts = courts
+        self.spaces = spaces
+        # 为空时所有日期返回同一组场地
+        self.dates = dates
+        # 每个接口每秒允许的请求数（0表示不限流）
+        self.throttle_rps = throttle_rps
+        self._recent: Dict[str, List[float]] = {}
+        self.time_slots = time_slots
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        # 每个请求以stall_probability的概率在到达服务器前额外停顿stall_ms
+        self.stall_probability = stall_probability
+        self.stall_ms = stall_ms
+        # 服务器时间 = 本机时间 + clock_skew_ms
+        self.clock_skew_ms = clock_skew_ms
+        self.competitors = competitors
+        self.competitor_delay_ms = competitor_delay_ms
+        self.contested_slot = contested_slot
+
+        self.lock = threading.Lock()
+        self._timers: List[threading.Timer] = []
+        self.tokens: Dict[str, str] = {}
+        self._ids = itertools.count(1)
+        self._httpd = None
+        self._thread = None
+        self.reset(release_at)
+
+    # ---- 服务器状态 ----
+
+    def server_time(self) -> float:
+        """服务器时钟（秒）"""
+        return time.time() + self.clock_skew_ms / 1000
+
+    def reset(self, release_at: Optional[float] = None):
+        """
+        重置场地和订单状态，release_at为服务器时钟下的放票时刻，None表示立即开放
+        """
+        with self.lock:
+            # 取消上一轮尚未触发的竞争者，避免它们锁定新一轮的场地
+            for timer in self._timers:
+                timer.cancel()
+            self._timers = []
+            self.release_at = release_at
+            self.open_slice: Dict[str, Dict[str, Any]] = {}
+            # slice_id -> (所属场馆的spaceId, 日期)
+            self.slice_sources: Dict[str, Tuple[str, str]] = {}
+            for date_index, date in enumerate(self.dates or ("",)):
+                for index, space_id in enumerate(self.spaces):
+                    slice_id = 1000 + index * 10000 + date_index * 1000000
+                    for court in range(1, self.courts + 1):
+                        for time_slot in self.time_slots:
+                            slice_id += 1
+                            self.open_slice[str(slice_id)] = {
+                                "slice_time": time_slot,
+                                "is_lock": 0,
+                                "slice_name": f"{court}号场",
+                            }
+                            self.slice_sources[str(slice_id)] = (space_id, date)
+            # 每个订单: (slice_id, 下单者, 服务器接收时刻)
+            self.orders: List[Tuple[str, str, float]] = []
+            # 订单号 -> slice_id
+            self.order_slices: Dict[int, str] = {}
+            self.request_counts: Dict[str, int] = {}
+            self.throttled_counts: Dict[str, int] = {}
+            self._competitors_started = False
+
+    def _maybe_start_competitors(self):
+        if self._competitors_started or not self.competitors or self.release_at is None:
+            return
+        self._competitors_started = True
+        for index in range(self.competitors):
+            delay = random.uniform(*self.competitor_delay_ms) / 1000
+            start_in = max(0.0, self.release_at - self.server_time()) + delay
+            timer = threading.Timer(start_in, self._competitor_grab, args=(f"competitor-{index}",))
+            timer.daemon = True
+            timer.start()
+            self._timers.append(timer)
+
+    def _competitor_grab(self, name: str):
+        with self.lock:
+            free = [slice_id for slice_id, info in self.open_slice.items()
+                    if info["slice_time"] == self.contested_slot and info["is_lock"] != 1]
+            if free:
+                slice_id = random.choice(free)
+                self.open_slice[slice_id]["is_lock"] = 1
+                self.orders.append((slice_id, name, self.server_time()))
+
+    def schedule_competitors(self):
+        """放票时刻已知时提前安排竞争者抢场"""
+        with self.lock:
+            self._maybe_start_competitors()
+
+    def orders_by(self, owner: str) -> List[Tuple[str, str, float]]:
+        with self.lock:
+            return [order for order in self.orders if order[1] == owner]
+
+    def unlock(self, slice_id: str):
+        """模拟订单超时未支付，场地重新释放"""
+        with self.lock:
+            self.open_slice[slice_id]["is_lock"] = 0
+            self.orders = [order for order in self.orders if order[0] != slice_id]
+
+    def _over_limit(self, endpoint: str) -> bool:
+        """最近一秒内该接口的请求数是否超过throttle_rps（调用方持有锁）"""
+        if not self.throttle_rps:
+            return False
+        now = time.time()
+        recent = [t for t in self._recent.get(endpoint, ()) if now - t < 1.0]
+        recent.append(now)
+        self._recent[endpoint] = recent
+        return len(recent) > self.throttle_rps
+
+    # ---- 接口实现 ----
+
+    def handle(self, path: str, query: Dict[str, List[str]], form: Dict[str, Any],
+               token: Optional[str]) -> Dict[str, Any]:
+        endpoint = path[len(API_PREFIX):] if path.startswith(API_PREFIX) else path
+        with self.lock:
+            self.request_counts[endpoint] = self.request_counts.get(endpoint, 0) + 1
+            if self._over_limit(endpoint):
+                self.throttled_counts[endpoint] = self.throttled_counts.get(endpoint, 0) + 1
+                return {"actionState": 0, "msg": THROTTLED_MESSAGE}
+
+        if endpoint == "/user/loginSms":
+            return {"actionState": 1, "msg": "验证码已发送"}
+
+        if endpoint == "/user/SOLoginPhone":
+            phone = form.get("phone", "")
+            new_token = f"mock-token-{next(self._ids)}"
+            with self.lock:
+                self.tokens[new_token] = phone
+            return {"actionState": 0, "data": {"token": new_token, "userId": f"u{phone}"}}
+
+        owner = self.tokens.get(token or "")
+        if owner is None:
+            return {"actionState": -1, "msg": TOKEN_INVALID_MESSAGE}
+
+        if endpoint == "/user/verifiedInfo":
+            return {"actionState": 1, "data": {"phonestr": owner, "name": "测试用户"}}
+
+        if endpoint == "/open/getSpaceOrderDetailsNew":
+            source = (query.get("spaceId", [self.spaces[0]])[0], query.get("time", [""])[0] if self.dates else "")
+            with self.lock:
+                open_slice = {slice_id: dict(info) for slice_id, info in self.open_slice.items()
+                              if self.slice_sources[slice_id] == source}
+            return {"actionState": 1, "data": {"openSlice": open_slice}}
+
+        if endpoint == "/order/createOrderBatch":
+            slice_id = str(form.get("soOpenid"))
+            received_at = self.server_time()
+            with self.lock:
+                self._maybe_start_competitors()
+                if self.release_at is not None and received_at < self.release_at:
+                    return {"actionState": 0, "msg": NOT_OPEN_MESSAGE}
+                info = self.open_slice.get(slice_id)
+                if info is None or info["is_lock"] == 1:
+                    return {"actionState": 0, "msg": SOLD_MESSAGE}
+                info["is_lock"] = 1
+                self.orders.append((slice_id, token, received_at))
+                order_id = next(self._ids)
+                self.order_slices[order_id] = slice_id
+            return {"actionState": 1, "data": {
+                "codeUrl": f"weixin://wxpay/bizpayurl?pr=mock{order_id}",
+                "orderId": order_id,
+            }}
+
+        if endpoint == CANCEL_ORDER_PATH:
+            try:
+                order_id = int(form.get("orderId"))
+            except (TypeError, ValueError):
+                order_id = None
+            with self.lock:
+                slice_id = self.order_slices.pop(order_id, None)
+            if slice_id is None:
+                return {"actionState": 0, "msg": "订单不存在"}
+            self.unlock(slice_id)
+            return {"actionState": 1, "msg": "订单已取消"}
+
+        return {"actionState": -1, "msg": f"未知接口: {endpoint}"}
+
+    # ---- HTTP服务 ----
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # 响应头和响应体分两次写出，关闭Nagle避免与客户端延迟ACK叠加出40ms停顿
+            disable_nagle_algorithm = True
+
+            def date_time_string(self, timestamp=None):
+                return formatdate(server.server_time(), usegmt=True)
+
+            def log_message(self, format, *args):
+                pass
+
+            def _delay(self, stall: bool = False):
+                # 往返延迟对半分摊到请求和响应两个方向，模拟对称的网络
+                delay = server.latency_ms + random.uniform(0, server.jitter_ms)
+                if delay > 0:
+                    time.sleep(delay / 2000)
+                if stall and server.stall_probability and random.random() < server.stall_probability:
+                    time.sleep(server.stall_ms / 1000)
+
+            def do_HEAD(self):
+                self._delay()
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self._delay()
+                self.end_headers()
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                parts = urlsplit(self.path)
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    form = json.loads(body or b"{}")
+                else:
+                    form = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+                self._delay(stall=True)
+                result = server.handle(parts.path, parse_qs(parts.query), form, self.headers.get("Token"))
+                payload = json.dumps(result, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json;charset=UTF-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self._delay()
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST
+
+        return Handler
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}{API_PREFIX}"
+
+    def start(self) -> "MockOpenscServer":
+        self._httpd = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="opensc接口本地替身服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9071)
+    parser.add_argument("--courts", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--clock-skew-ms", type=float, default=0.0)
+    parser.add_argument("--release-in", type=float, default=None, help="多少秒后放票（默认立即开放）")
+    parser.add_argument("--competitors", type=int, default=0)
+    parser.add_argument("--stall-probability", type=float, default=0.0)
+    parser.add_argument("--stall-ms", type=float, default=200.0)
+    parser.add_argument("--spaces", default="111162", help="逗号分隔的场馆spaceId")
+    parser.add_argument("--throttle-rps", type=float, default=0.0, help="每个接口每秒允许的请求数（0不限流）")
+    args = parser.parse_args()
+
+    server = MockOpenscServer(host=args.host, port=args.port, courts=args.courts,
+                              latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                              clock_skew_ms=args.clock_skew_ms, competitors=args.competitors,
+                              stall_probability=args.stall_probability, stall_ms=args.stall_ms,
+                              spaces=tuple(args.spaces.split(",")), throttle_rps=args.throttle_rps)
+    if args.release_in is not None:
+        server.reset(server.server_time() + args.release_in)
+        server.schedule_competitors()
+    server.start()
+    print(f"模拟服务器已启动: {server.base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
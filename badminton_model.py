@@ -0,0 +1,175 @@
+"""
+场地余量的紧凑索引模型
+
+把getSpaceOrderDetailsNew的openSlice解析一次，按日期、时间段和场地名称建立索引，
+支持“18:30--20:30，否则16:30--18:30，场地按自定义顺序，跳过已锁定”这类偏好查询，
+并可用更新的快照增量更新。多个场馆、多个日期的快照可以合并到同一个模型中统一排序。
+"""
+import json
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+try:
+    import orjson
+except ImportError:  # 可选依赖，未安装时使用标准库
+    orjson = None
+
+
+def decode_json(content: bytes) -> Any:
+    """直接从响应字节解码JSON，安装了orjson时使用orjson"""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+class CourtSlice:
+    """某场馆某日期某时间段的一块场地，venue为场馆的space_id（只查一个场馆时可为空）"""
+    __slots__ = ("court_id", "date", "slice_time", "court_name", "locked", "venue")
+
+    def __init__(self, court_id: str, date: str, slice_time: str, court_name: str, locked: bool,
+                 venue: str = ""):
+        self.court_id = court_id
+        self.date = date
+        self.slice_time = slice_time
+        self.court_name = court_name
+        self.locked = locked
+        self.venue = venue
+
+    def as_candidate(self) -> Dict[str, str]:
+        """转换为下单流程使用的候选场地字典"""
+        candidate = {"court_id": self.court_id, "court_name": self.court_name, "slice_time": self.slice_time}
+        if self.venue:
+            candidate["venue"] = self.venue
+            candidate["date"] = self.date
+        return candidate
+
+    def __repr__(self):
+        state = "已锁定" if self.locked else "可用"
+        venue = f"{self.venue} " if self.venue else ""
+        return f"CourtSlice({self.court_id}, {venue}{self.date} {self.slice_time} {self.court_name}, {state})"
+
+
+def parse_time_slots(time_slot: str) -> List[str]:
+    """逗号分隔的多个时间段，靠前的优先"""
+    return [slot.strip() for slot in time_slot.replace("，", ",").split(",") if slot.strip()]
+
+
+class Availability:
+    def __init__(self):
+        # 场地ID -> 场地
+        self.slices: Dict[str, CourtSlice] = {}
+        # (日期, 时间段) -> {场地ID: 场地}
+        self._by_slot: Dict[Tuple[str, str], Dict[str, CourtSlice]] = {}
+        # (日期, 场地名称) -> {场地ID: 场地}
+        self._by_name: Dict[Tuple[str, str], Dict[str, CourtSlice]] = {}
+        # (日期, 场馆) -> 上次快照中的场地ID，判断消失的场地时只需比较这一部分
+        self._by_source: Dict[Tuple[str, str], set] = {}
+
+    @classmethod
+    def from_response(cls, courts_data: Dict[str, Any], date: str = "",
+                      slice_times: Optional[Sequence[str]] = None, venue: str = "") -> "Availability":
+        """由一次响应建立模型，指定slice_times时只收录这些时间段的场地"""
+        model = cls()
+        if slice_times is None:
+            model.update(courts_data, date, venue)
+        elif "data" in courts_data and "openSlice" in courts_data["data"]:
+            wanted = set(slice_times)
+            model.update_entries(((court_id, info) for court_id, info in courts_data["data"]["openSlice"].items()
+                                  if info.get("slice_time") in wanted), date, venue)
+        return model
+
+    def _index(self, court: CourtSlice):
+        self._by_slot.setdefault((court.date, court.slice_time), {})[court.court_id] = court
+        self._by_name.setdefault((court.date, court.court_name), {})[court.court_id] = court
+
+    def _unindex(self, court: CourtSlice):
+        self._by_slot.get((court.date, court.slice_time), {}).pop(court.court_id, None)
+        self._by_name.get((court.date, court.court_name), {}).pop(court.court_id, None)
+
+    def _remove(self, court_id: str) -> CourtSlice:
+        court = self.slices.pop(court_id)
+        self._unindex(court)
+        self._by_source.get((court.date, court.venue), set()).discard(court_id)
+        return court
+
+    def update(self, courts_data: Dict[str, Any], date: str = "", venue: str = "") -> List[str]:
+        """
+        用某场馆某日期的新快照增量更新模型，返回新增、变化或消失的场地ID
+        """
+        if "data" not in courts_data or "openSlice" not in courts_data["data"]:
+            return []
+        return self.update_entries(courts_data["data"]["openSlice"].items(), date, venue)
+
+    def update_entries(self, entries, date: str = "", venue: str = "") -> List[str]:
+        """
+        用(场地ID, {slice_time, is_lock, slice_name})序列增量更新某场馆某日期的场地
+        """
+        changed = []
+        seen = set()
+        slices = self.slices
+        for court_id, info in entries:
+            seen.add(court_id)
+            # 只读取下单逻辑需要的三个字段
+            slice_time = info.get("slice_time")
+            court_name = info.get("slice_name", "")
+            locked = info.get("is_lock") == 1
+            court = slices.get(court_id)
+            if court is not None and (court.date != date or court.venue != venue):
+                self._remove(court_id)
+                court = None
+            if court is not None:
+                if (court.slice_time, court.court_name, court.locked) == (slice_time, court_name, locked):
+                    continue
+                self._unindex(court)
+                court.slice_time, court.court_name, court.locked = slice_time, court_name, locked
+            else:
+                court = CourtSlice(court_id, date, slice_time, court_name, locked, venue)
+                slices[court_id] = court
+            self._index(court)
+            changed.append(court_id)
+
+        # 新快照中已不存在的场地，只在同一场馆同一日期上次的快照范围内比较
+        previous = self._by_source.get((date, venue))
+        if previous:
+            for court_id in previous - seen:
+                if court_id in slices:
+                    self._remove(court_id)
+                    changed.append(court_id)
+        self._by_source[(date, venue)] = seen
+        return changed
+
+    def slot(self, date: str, slice_time: str) -> List[CourtSlice]:
+        """某日期某时间段的全部场地"""
+        return list(self._by_slot.get((date, slice_time), {}).values())
+
+    def court(self, date: str, court_name: str) -> List[CourtSlice]:
+        """某日期某块场地的全部时间段"""
+        return list(self._by_name.get((date, court_name), {}).values())
+
+    def query(self, date: str, time_slots: Sequence[str], court_order: Optional[Sequence[str]] = None,
+              skip_locked: bool = True, venue_order: Optional[Sequence[str]] = None) -> List[CourtSlice]:
+        """
+        按时间段偏好依次列出场地：靠前时间段的场地排在前面；同一时间段内先按venue_order排列场馆，
+        同一场馆内按court_order排序，未列出的场地排在后面并按名称倒序
+        """
+        rank = {name: index for index, name in enumerate(court_order or ())}
+        venue_rank = {venue: index for index, venue in enumerate(venue_order or ())}
+        result = []
+        for slice_time in time_slots:
+            courts = [court for court in self._by_slot.get((date, slice_time), {}).values()
+                      if not (skip_locked and court.locked)]
+            # 先按名称倒序，再按自定义顺序、场馆顺序稳定排序
+            courts.sort(key=lambda court: court.court_name, reverse=True)
+            courts.sort(key=lambda court: rank.get(court.court_name, len(rank)))
+            if venue_rank:
+                courts.sort(key=lambda court: venue_rank.get(court.venue, len(venue_rank)))
+            result.extend(courts)
+        return result
+
+    def query_dates(self, dates: Sequence[str], time_slots: Sequence[str],
+                    court_order: Optional[Sequence[str]] = None, skip_locked: bool = True,
+                    venue_order: Optional[Sequence[str]] = None) -> List[CourtSlice]:
+        """多个日期依次查询并合并，靠前的日期优先"""
+        result = []
+        for date in dates:
+            result.extend(self.query(date, time_slots, court_order, skip_locked, venue_order))
+        return result
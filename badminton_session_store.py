@@ -0,0 +1,189 @@
+"""
+本地会话缓存
+
+按手机号保存token、user_id、phone_str及过期信息，重启后无需再次短信登录。
+文件落盘时加密：Windows使用DPAPI（与当前Windows用户绑定）；其他系统使用仅本用户可读的随机密钥文件，
+以HMAC-SHA256计数器模式生成密钥流加密，并用HMAC-SHA256校验完整性。
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+from typing import Dict, Any, Optional
+
+MAGIC = b"BKS1"
+# 无法从token得知有效期时假定的有效时长（秒）
+DEFAULT_TTL = 7 * 24 * 3600
+
+
+def default_data_dir() -> str:
+    """本地数据（会话缓存、运行历史）的默认目录"""
+    base = os.environ.get("APPDATA") or os.path.expanduser("~")
+    return os.path.join(base, ".badminton_booking")
+
+
+def token_expiry(token: str) -> Optional[float]:
+    """token是JWT时读取其exp字段"""
+    parts = token.split(".") if token else []
+    if len(parts) != 3:
+        return None
+    try:
+        payload = parts[1] + "=" * (-len(parts[1]) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+        return float(exp) if exp else None
+    except (ValueError, TypeError):
+        return None
+
+
+class _DpapiCipher:
+    """Windows DPAPI，密钥由系统按当前用户管理"""
+
+    def __init__(self):
+        import ctypes
+        from ctypes import wintypes
+
+        class DataBlob(ctypes.Structure):
+            _fields_ = [("cbData", wintypes.DWORD), ("pbData", ctypes.POINTER(ctypes.c_char))]
+
+        self._ctypes = ctypes
+        self._blob = DataBlob
+        self._crypt32 = ctypes.windll.crypt32
+        self._kernel32 = ctypes.windll.kernel32
+
+    def _call(self, func, data: bytes) -> bytes:
+        ctypes = self._ctypes
+        buffer = ctypes.create_string_buffer(data, len(data))
+        blob_in = self._blob(len(data), ctypes.cast(buffer, ctypes.POINTER(ctypes.c_char)))
+        blob_out = self._blob()
+        if not func(ctypes.byref(blob_in), None, None, None, None, 0, ctypes.byref(blob_out)):
+            raise OSError("DPAPI调用失败")
+        try:
+            return ctypes.string_at(blob_out.pbData, blob_out.cbData)
+        finally:
+            self._kernel32.LocalFree(blob_out.pbData)
+
+    def encrypt(self, data: bytes) -> bytes:
+        return self._call(self._crypt32.CryptProtectData, data)
+
+    def decrypt(self, data: bytes) -> bytes:
+        return self._call(self._crypt32.CryptUnprotectData, data)
+
+
+class _KeyFileCipher:
+    """随机密钥文件 + HMAC-SHA256计数器模式密钥流 + HMAC校验"""
+
+    def __init__(self, key_path: str):
+        if not os.path.exists(key_path):
+            fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(secrets.token_bytes(32))
+        with open(key_path, "rb") as f:
+            key = f.read()
+        self._enc_key = hmac.new(key, b"encrypt", hashlib.sha256).digest()
+        self._mac_key = hmac.new(key, b"authenticate", hashlib.sha256).digest()
+
+    def _keystream(self, nonce: bytes, length: int) -> bytes:
+        blocks = []
+        for counter in range((length + 31) // 32):
+            blocks.append(hmac.new(self._enc_key, nonce + counter.to_bytes(8, "big"), hashlib.sha256).digest())
+        return b"".join(blocks)[:length]
+
+    def encrypt(self, data: bytes) -> bytes:
+        nonce = secrets.token_bytes(16)
+        cipher = bytes(a ^ b for a, b in zip(data, self._keystream(nonce, len(data))))
+        tag = hmac.new(self._mac_key, nonce + cipher, hashlib.sha256).digest()
+        return nonce + tag + cipher
+
+    def decrypt(self, data: bytes) -> bytes:
+        nonce, tag, cipher = data[:16], data[16:48], data[48:]
+        expected = hmac.new(self._mac_key, nonce + cipher, hashlib.sha256).digest()
+        if not hmac.compare_digest(tag, expected):
+            raise ValueError("会话缓存校验失败")
+        return bytes(a ^ b for a, b in zip(cipher, self._keystream(nonce, len(cipher))))
+
+
+class SessionStore:
+    def __init__(self, directory: Optional[str] = None, ttl: float = DEFAULT_TTL):
+        self.directory = directory or default_data_dir()
+        self.path = os.path.join(self.directory, "session.bin")
+        self.ttl = ttl
+        self._cipher = None
+        # 多个账号可能同时更新同一个缓存文件
+        self._lock = threading.RLock()
+
+    def _get_cipher(self):
+        if self._cipher is None:
+            os.makedirs(self.directory, exist_ok=True)
+            if sys.platform == "win32":
+                self._cipher = _DpapiCipher()
+            else:
+                self._cipher = _KeyFileCipher(os.path.join(self.directory, "session.key"))
+        return self._cipher
+
+    def _read_all(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+            if not data.startswith(MAGIC):
+                return {}
+            return json.loads(self._get_cipher().decrypt(data[len(MAGIC):]).decode("utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _write_all(self, sessions: Dict[str, Dict[str, Any]]):
+        payload = self._get_cipher().encrypt(json.dumps(sessions).encode("utf-8"))
+        tmp_path = self.path + ".tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC + payload)
+        os.replace(tmp_path, self.path)
+
+    def save(self, phone: str, token: str, user_id: Any, phone_str: Optional[str] = None,
+             expires_at: Optional[float] = None) -> Dict[str, Any]:
+        """
+        保存或更新某手机号的会话，未指定过期时间时优先读取JWT的exp，否则按ttl计算
+        """
+        now = time.time()
+        if expires_at is None:
+            expires_at = token_expiry(token) or now + self.ttl
+        with self._lock:
+            sessions = self._read_all()
+            previous = sessions.get(phone, {})
+            entry = {
+                "token": token,
+                "user_id": user_id,
+                "phone_str": phone_str or (previous.get("phone_str") if previous.get("token") == token else None),
+                "saved_at": now,
+                "validated_at": now,
+                "expires_at": expires_at,
+            }
+            sessions[phone] = entry
+            self._write_all(sessions)
+        return entry
+
+    def load(self, phone: str) -> Optional[Dict[str, Any]]:
+        """读取未过期的会话"""
+        entry = self._read_all().get(phone)
+        if not entry or entry.get("expires_at", 0) <= time.time():
+            return None
+        return entry
+
+    def last_phone(self) -> Optional[str]:
+        """最近保存过会话的手机号"""
+        sessions = self._read_all()
+        if not sessions:
+            return None
+        return max(sessions, key=lambda phone: sessions[phone].get("saved_at", 0))
+
+    def clear(self, phone: str):
+        with self._lock:
+            sessions = self._read_all()
+            if sessions.pop(phone, None) is not None:
+                self._write_all(sessions)
@@ -0,0 +1,121 @@
+"""
+运行时间线：记录每次HTTP请求各阶段（排队、建连、发送、首字节、响应体）和内部阶段（准备、等待、下单、二维码）
+的单调高精度时间戳，换算为相对放票时刻的偏移，可导出为JSON Lines并生成摘要。
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+from urllib.parse import urlsplit
+
+# 当前线程正在进行的HTTP请求计时记录，由适配器设置，连接层补充建连/发送时间
+_http_trace = threading.local()
+
+
+def current_trace() -> Optional[Dict[str, Any]]:
+    return getattr(_http_trace, "current", None)
+
+
+def set_current_trace(trace: Optional[Dict[str, Any]]):
+    _http_trace.current = trace
+
+
+class RunTimeline:
+    def __init__(self):
+        # 同一时刻的墙上时钟和单调时钟，用于把perf_counter换算为时间戳
+        self.origin_wall = time.time()
+        self.origin_mono = time.perf_counter()
+        # 放票时刻（本地时间戳），确定后各记录带上相对放票时刻的偏移
+        self.target: Optional[float] = None
+        self.records: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def wall(self, mono: float) -> float:
+        return self.origin_wall + (mono - self.origin_mono)
+
+    def rel_target_ms(self, mono: Optional[float]) -> Optional[float]:
+        if mono is None or self.target is None:
+            return None
+        return round((self.wall(mono) - self.target) * 1000, 3)
+
+    def _ms(self, start: Optional[float], end: Optional[float]) -> Optional[float]:
+        if start is None or end is None:
+            return None
+        return round((end - start) * 1000, 3)
+
+    def add(self, kind: str, name: str, **fields):
+        record = {"kind": kind, "name": name}
+        record.update(fields)
+        with self._lock:
+            self.records.append(record)
+
+    @contextmanager
+    def phase(self, name: str, **fields):
+        """记录一个内部阶段的起止时间"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.add("phase", name, start=round(self.wall(start), 6),
+                     start_rel_target_ms=self.rel_target_ms(start),
+                     duration_ms=self._ms(start, end), **fields)
+
+    def record_http(self, trace: Dict[str, Any]):
+        """
+        记录一次HTTP请求：queue为等待连接池，connect为建连（含TLS），
+        server为发送完成到首字节，body为读取响应体
+        """
+        t_queue = trace["t_queue"]
+        t_conn = trace.get("t_conn")
+        t_sent = trace.get("t_sent")
+        t_first_byte = trace.get("t_first_byte")
+        self.add(
+            "http", urlsplit(trace["url"]).path.rsplit("/", 1)[-1],
+            method=trace["method"],
+            thread=trace["thread"],
+            status=trace.get("status"),
+            error=trace.get("error"),
+            reused=trace.get("t_connect_start") is None,
+            start=round(self.wall(t_queue), 6),
+            sent_rel_target_ms=self.rel_target_ms(t_sent),
+            queue_ms=self._ms(t_queue, t_conn),
+            dns_tcp_ms=self._ms(trace.get("t_connect_start"), trace.get("t_tcp")),
+            connect_ms=self._ms(trace.get("t_connect_start"), trace.get("t_connect_end")),
+            server_ms=self._ms(t_sent, t_first_byte),
+            body_ms=self._ms(t_first_byte, trace.get("t_body")),
+            total_ms=self._ms(t_queue, trace.get("t_body") or t_first_byte),
+            governor_wait_ms=trace.get("governor_wait_ms"),
+        )
+
+    def to_jsonl(self) -> str:
+        header = {"kind": "run", "name": "timeline", "start": round(self.origin_wall, 6),
+                  "target": self.target}
+        with self._lock:
+            lines = [json.dumps(header, ensure_ascii=False)]
+            lines.extend(json.dumps(record, ensure_ascii=False) for record in self.records)
+        return "\n".join(lines) + "\n"
+
+    def save(self, path: str) -> str:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_jsonl())
+        return path
+
+    def summary_lines(self) -> List[str]:
+        """阶段耗时和下单请求各阶段耗时的可读摘要"""
+        lines = []
+        with self._lock:
+            records = list(self.records)
+        for record in records:
+            if record["kind"] == "phase":
+                lines.append(f"阶段 {record['name']}: {record['duration_ms']:.1f} ms")
+            elif record["kind"] == "http" and record["name"] == "createOrderBatch":
+                sent = record["sent_rel_target_ms"]
+                sent_text = f"{sent:+.1f} ms" if sent is not None else "-"
+                connect = "复用连接" if record["reused"] else f"建连 {record['connect_ms']} ms"
+                lines.append(
+                    f"下单请求: 相对放票 {sent_text}，排队 {record['queue_ms']} ms，{connect}，"
+                    f"服务器 {record['server_ms']} ms，总计 {record['total_ms']} ms"
+                )
+        return lines
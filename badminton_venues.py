@@ -0,0 +1,67 @@
+"""
+场馆目录
+
+每个场馆由space_id和sport_type确定，与getSpaceOrderDetailsNew的spaceId、sportType参数对应。
+目录按偏好排序：多个场馆同一时间段都有空场时，靠前的场馆优先。
+
+目录文件为JSON列表，例如：
+[
+    {"space_id": "111162", "sport_type": "2", "name": "湘湖小学羽毛球"},
+    {"space_id": "111163", "sport_type": "2", "name": "另一个场馆"}
+]
+"""
+import json
+from typing import Any, Dict, List, Optional, Sequence
+
+
+class Venue:
+    """一个可预约的场馆"""
+    __slots__ = ("space_id", "sport_type", "name")
+
+    def __init__(self, space_id: str, sport_type: str = "2", name: str = ""):
+        self.space_id = str(space_id)
+        self.sport_type = str(sport_type)
+        self.name = name or self.space_id
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Venue":
+        return cls(data["space_id"], data.get("sport_type", "2"), data.get("name", ""))
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"space_id": self.space_id, "sport_type": self.sport_type, "name": self.name}
+
+    def __eq__(self, other):
+        return isinstance(other, Venue) and (self.space_id, self.sport_type) == (other.space_id, other.sport_type)
+
+    def __hash__(self):
+        return hash((self.space_id, self.sport_type))
+
+    def __repr__(self):
+        return f"Venue({self.space_id}, {self.sport_type}, {self.name})"
+
+
+DEFAULT_VENUES = (Venue("111162", "2", "湘湖小学羽毛球"),)
+
+
+def parse_venues(items: Optional[Sequence[Any]]) -> List[Venue]:
+    """把配置中的场馆列表（字典或space_id字符串）转换为Venue，为空时使用默认场馆"""
+    if not items:
+        return list(DEFAULT_VENUES)
+    venues = []
+    for item in items:
+        venue = item if isinstance(item, Venue) else (
+            Venue.from_dict(item) if isinstance(item, dict) else Venue(item))
+        if venue not in venues:
+            venues.append(venue)
+    return venues
+
+
+def load_venues(path: str) -> List[Venue]:
+    """从JSON文件读取场馆目录"""
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_venues(json.load(f))
+
+
+def venue_names(venues: Sequence[Venue]) -> Dict[str, str]:
+    """space_id -> 场馆名称，用于日志显示"""
+    return {venue.space_id: venue.name for venue in venues}
@@ -0,0 +1,243 @@
+"""
+放票前后台轮询场地余量
+
+越接近放票轮询越快；用新快照增量更新场地模型，只有目标时间段的场地变化时才重新排序候选场地，
+下单时直接取用最近一次的候选列表，不需要在关键路径上同步请求。
+每次轮询同时查询所有场馆和备选日期，合并为一个跨场馆的候选列表。
+"""
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+import requests
+
+from badminton_model import Availability, parse_time_slots
+
+# (距离放票的秒数上限, 轮询间隔秒数)，按距离从近到远排列
+DEFAULT_SCHEDULE = (
+    (5.0, 0.2),
+    (30.0, 1.0),
+    (120.0, 3.0),
+    (float("inf"), 10.0),
+)
+
+
+class AvailabilityWatcher:
+    def __init__(self, booking, date: str, time_slot: str, release_at: float,
+                 schedule=DEFAULT_SCHEDULE, pause_before: float = 0.1, extra_dates: Tuple[str, ...] = ()):
+        self.booking = booking
+        self.date = date
+        self.extra_dates = tuple(extra_dates)
+        self.time_slot = time_slot
+        self.release_at = release_at
+        self.schedule = schedule
+        # 开始下单前这段时间停止轮询，避免解析响应与下单争抢CPU
+        self.pause_before = pause_before
+
+        # 独立的会话和连接池，不占用为下单预热的连接；每个场馆和日期的组合各保留一条连接
+        pool_size = max(2, len(booking.venues) * (1 + len(self.extra_dates)))
+        self.session = requests.Session()
+        self.session.headers.update(booking.session.headers)
+        self.session.mount("https://", booking.new_adapter(pool_size))
+        self.session.mount("http://", booking.new_adapter(pool_size))
+
+        self.time_slots = set(parse_time_slots(time_slot))
+        self.availability = Availability()
+
+        self._lock = threading.Lock()
+        self._candidates: List[Dict[str, str]] = []
+        self._updated_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.polls = 0
+        self.changes = 0
+
+    def interval(self) -> float:
+        """按距离放票的时间选择轮询间隔"""
+        remaining = self.release_at - time.time()
+        for horizon, interval in self.schedule:
+            if remaining <= horizon:
+                return interval
+        return self.schedule[-1][1]
+
+    def poll_once(self) -> bool:
+        """
+        拉取一次场地信息，相关条目有变化时更新候选列表，返回是否有变化
+        """
+        # 场地模型只在轮询线程中更新，请求期间不持有锁，下单线程随时可以读取候选列表
+        try:
+            scan = self.booking.scan_availability([self.date, *self.extra_dates], session=self.session,
+                                                  model=self.availability)
+        except Exception as e:
+            self.booking.log_message(f"轮询场地失败: {e}", level="WARNING")
+            return False
+        for failure in scan["errors"]:
+            self.booking.log_message(f"轮询场地失败: {failure['date']} 场馆{failure['venue']}: {failure['error']}",
+                                     level="WARNING")
+        if len(scan["errors"]) == len(self.booking.venues) * (1 + len(self.extra_dates)):
+            return False
+
+        self.polls += 1
+        now = time.time()
+        with self._lock:
+            self._updated_at = now
+            first = not self.changes
+            changed = scan["changed"]
+            # 只关心目标时间段的场地（已消失的场地也算变化）
+            relevant = [court_id for court_id in changed
+                        if court_id not in self.availability.slices
+                        or self.availability.slices[court_id].slice_time in self.time_slots]
+            if not first and not relevant:
+                return False
+            previous = {court["court_id"] for court in self._candidates}
+            self._candidates = self.booking.select_courts(self.availability, self.date, self.time_slot,
+                                                          self.extra_dates)
+            current = {court["court_id"] for court in self._candidates}
+
+        if self.changes:
+            self.booking.log_message(
+                f"场地变化: 新增可用 {len(current - previous)} 个，不再可用 {len(previous - current)} 个",
+                payload=self._candidates)
+        self.changes += 1
+        return True
+
+    def pause_at(self) -> float:
+        """停止轮询的时刻：第一个下单请求发出（已扣除往返时延、提前量和突发窗口起点）前pause_before秒"""
+        return self.booking._send_start(self.release_at) - self.pause_before
+
+    def _run(self):
+        while not self._stop.is_set():
+            if time.time() >= self.pause_at():
+                break
+            self.poll_once()
+            wait = min(self.interval(), max(0.0, self.pause_at() - time.time()))
+            self._stop.wait(wait)
+
+    def start(self) -> "AvailabilityWatcher":
+        self._thread = threading.Thread(target=self._run, name="availability-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.session.close()
+
+    def snapshot(self) -> Tuple[List[Dict[str, str]], Optional[float]]:
+        """当前候选列表及其距今的秒数（从未成功轮询时为None）"""
+        with self._lock:
+            if self._updated_at is None:
+                return [], None
+            return list(self._candidates), time.time() - self._updated_at
+
+    def fresh_candidates(self, max_age: float) -> Optional[List[Dict[str, str]]]:
+        """候选列表足够新且非空时返回，否则返回None（下单时沿用预约计划）"""
+        candidates, age = self.snapshot()
+        if age is None or age > max_age or not candidates:
+            return None
+        return candidates
+
+
+# 放票失败后继续监视时的轮询间隔（秒）：最短、最长，以及每次无变化后的增长倍数
+RECAPTURE_INTERVALS = (0.5, 10.0, 1.5)
+
+
+class RecaptureWatcher:
+    """
+    放票失败后继续监视目标(日期, 时间段)：别人的订单超时未支付、场地重新释放时立即下单。
+    未支付订单集中在放票后payment_window秒左右超时释放，这段时间前后expiry_spread秒内用最短间隔轮询，
+    其余时间没有变化就逐渐放慢；轮询走独立连接，下单使用定期保活的预热连接
+    """
+
+    def __init__(self, booking, plan, deadline: float, payment_window: float = 600.0,
+                 expiry_spread: float = 60.0, intervals=RECAPTURE_INTERVALS):
+        self.booking = booking
+        self.plan = plan
+        self.deadline = deadline
+        self.expire_at = plan.release_at + payment_window
+        self.expiry_spread = expiry_spread
+        self.intervals = intervals
+        self.dates = [plan.date, *plan.extra_dates]
+
+        pool_size = max(2, len(booking.venues) * len(self.dates))
+        self.session = requests.Session()
+        self.session.headers.update(booking.session.headers)
+        self.session.mount("https://", booking.new_adapter(pool_size))
+        self.session.mount("http://", booking.new_adapter(pool_size))
+
+        self.time_slots = set(parse_time_slots(plan.time_slot))
+        # 只抢计划中的场地：多账号活动中各计划分到的场地互不重叠，捡漏时也不和自己人抢同一块场地
+        self.court_ids = {court["court_id"] for court in plan.courts}
+        self.availability = Availability()
+        self._stop = threading.Event()
+        self.polls = 0
+        self.idle_polls = 0
+        self.attempts = 0
+
+    def interval(self) -> float:
+        """超时释放的高峰附近用最短间隔，其余时间按连续无变化的次数指数放慢，但不会错过高峰的开始"""
+        low, high, growth = self.intervals
+        now = time.time()
+        if abs(now - self.expire_at) <= self.expiry_spread:
+            return low
+        interval = min(high, low * growth ** self.idle_polls)
+        if now < self.expire_at - self.expiry_spread:
+            interval = min(interval, self.expire_at - self.expiry_spread - now)
+        return interval
+
+    def poll_once(self) -> List[Dict[str, str]]:
+        """
+        拉取一次场地信息，返回目标时间段中新释放的候选场地（首次轮询返回全部空闲场地）
+        """
+        try:
+            scan = self.booking.scan_availability(self.dates, session=self.session, model=self.availability)
+        except Exception as e:
+            self.booking.log_message(f"轮询场地失败: {e}", level="WARNING")
+            return []
+        if len(scan["errors"]) == len(self.booking.venues) * len(self.dates):
+            self.booking.log_message(f"轮询场地失败: {scan['errors'][0]['error']}", level="WARNING")
+            return []
+
+        first = not self.polls
+        self.polls += 1
+        # 只对状态刚变化的场地下单：下单失败的场地要等它再次变化才会重试
+        relevant = {court_id for court_id in scan["changed"]
+                    if court_id in self.availability.slices
+                    and self.availability.slices[court_id].slice_time in self.time_slots}
+        if not first and not relevant:
+            return []
+        courts = self.booking.select_courts(self.availability, self.plan.date, self.plan.time_slot,
+                                            self.plan.extra_dates)
+        return [court for court in courts if court["court_id"] in self.court_ids
+                and (first or court["court_id"] in relevant)]
+
+    def run(self) -> Dict[str, Any]:
+        """
+        阻塞直到抢回场地、到达截止时刻或调用stop()，返回预约结果
+        """
+        booking = self.booking
+        orders = self.plan.orders()
+        next_keepalive = time.time() + booking.keepalive_interval
+        try:
+            while not self._stop.is_set() and time.time() < self.deadline:
+                courts = self.poll_once()
+                if courts:
+                    self.idle_polls = 0
+                    self.attempts += 1
+                    booking.log_message(f"有场地重新释放: {'、'.join(booking.court_label(c) for c in courts)}，立即下单")
+                    result = booking.submit_orders(courts, orders, self.plan.send_settings)
+                    if result.get("success"):
+                        return result
+                else:
+                    self.idle_polls += 1
+
+                # 两次轮询之间保活下单连接，场地释放时不需要重新握手
+                if time.time() >= next_keepalive:
+                    booking.refresh_connections(ping=True)
+                    next_keepalive = time.time() + booking.keepalive_interval
+                self._stop.wait(min(self.interval(), max(0.0, self.deadline - time.time())))
+        finally:
+            self.session.close()
+        return {"error": f"截止时刻前未能抢回 {self.plan.time_slot} 的场地（轮询 {self.polls} 次，下单 {self.attempts} 轮）"}
+
+    def stop(self):
+        self._stop.set()
@@ -1,4 +1,14 @@
 # -*- mode: python ; coding: utf-8 -*-
+import os
+
+# 打包方式：onefile（默认）为单个exe，每次启动都要解压到临时目录；
+# onedir为目录形式且不做UPX压缩，启动时无需解压，适合放票前临时打开。
+# 用法：set "BUILD_PROFILE=onedir" && pyinstaller 羽毛球预约系统.spec
+# （cmd的set BUILD_PROFILE=onedir && ...会把&&前的空格也算进值里，这里去掉首尾空白）
+profile = os.environ.get('BUILD_PROFILE', 'onefile').strip()
+if profile not in ('onefile', 'onedir'):
+    raise SystemExit(f'未知的BUILD_PROFILE: {profile}')
+onedir = profile == 'onedir'
 
 
 a = Analysis(
@@ -16,23 +26,51 @@ a = Analysis(
 )
 pyz = PYZ(a.pure)
 
-exe = EXE(
-    pyz,
-    a.scripts,
-    a.binaries,
-    a.datas,
-    [],
-    name='羽毛球预约系统',
-    debug=False,
-    bootloader_ignore_signals=False,
-    strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
-    console=False,
-    disable_windowed_traceback=False,
-    argv_emulation=False,
-    target_arch=None,
-    codesign_identity=None,
-    entitlements_file=None,
-)
+if onedir:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        [],
+        exclude_binaries=True,
+        name='羽毛球预约系统',
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=False,
+        console=False,
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+    )
+    coll = COLLECT(
+        exe,
+        a.binaries,
+        a.datas,
+        strip=False,
+        upx=False,
+        upx_exclude=[],
+        name='羽毛球预约系统',
+    )
+else:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        a.binaries,
+        a.datas,
+        [],
+        name='羽毛球预约系统',
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=True,
+        upx_exclude=[],
+        runtime_tmpdir=None,
+        console=False,
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+    )